@@ -1,6 +1,41 @@
-"""Umls within mongoDB."""
+"""
+Umls within mongoDB.
+
+Only the query classes are imported eagerly. The ingestion and export
+functions and the asyncio classes, together with their dependencies, are
+imported the first time they are used, so query-only programs do not pay
+for them.
+"""
+from importlib import import_module
+
 from .table import Concept, String, Term
-from .tablecreator import createdb
 from .db import Db
 
-__all__ = ["Concept", "String", "Term", "createdb", "Db"]
+# Maps lazily imported names to the module which defines them.
+_LAZY = {"createdb": ".tablecreator",
+         "loaddb": ".dump",
+         "exportdb": ".export",
+         "AsyncConcept": ".aio",
+         "AsyncString": ".aio",
+         "AsyncTerm": ".aio",
+         "AsyncDb": ".aio"}
+
+__all__ = ["Concept", "String", "Term", "createdb", "loaddb", "exportdb", "Db",
+           "AsyncConcept", "AsyncString", "AsyncTerm", "AsyncDb"]
+
+
+def __getattr__(name):
+    """Import ingestion and asyncio names on first use."""
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}"
+                             "".format(__name__, name))
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List lazily imported names as well."""
+    return sorted(set(globals()) | set(__all__))
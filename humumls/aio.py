@@ -0,0 +1,457 @@
+"""Asyncio variants of the connection, table and aggregate classes."""
+import asyncio
+from collections import defaultdict
+from functools import partial
+from itertools import chain
+
+from humumls.connection import Connection
+from humumls.table import String, Term, Concept
+
+
+class AsyncConnection(object):
+    """
+    Connection class for use within an asyncio event loop.
+
+    pymongo is blocking, so all calls which perform I/O are run in an
+    executor. pymongo clients are thread-safe, so a single connection can
+    be shared by all coroutines.
+
+    Parameters
+    ----------
+    dbname : string
+        The name of the database.
+    hostname : string
+        The hostname.
+    port : int
+        The port to connect to.
+    executor : concurrent.futures.Executor, optional, default None
+        The executor in which blocking calls are run. If this is None,
+        the default executor of the event loop is used.
+    options
+        Additional client options, see `Connection`.
+
+    Attributes
+    ----------
+    connection : Connection
+        The blocking connection which is wrapped.
+    client : MongoClient
+        The initialized mongoclient.
+    db : MongoDB.DB
+        The specific database queried by this connection.
+
+    """
+
+    def __init__(self,
+                 dbname="umls",
+                 hostname="localhost",
+                 port=27017,
+                 executor=None,
+                 **options):
+        """Create a new connection to a specified database."""
+        self.connection = Connection(dbname, hostname, port, **options)
+        self.executor = executor
+
+    @property
+    def client(self):
+        """The client of this process."""
+        return self.connection.client
+
+    @property
+    def db(self):
+        """The database of this process."""
+        return self.connection.db
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function in the executor.
+
+        Parameters
+        ----------
+        func : function
+            The function to run.
+        args, kwargs
+            The arguments to pass to func.
+
+        Returns
+        -------
+        result : object
+            The return value of func.
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          partial(func, *args, **kwargs))
+
+
+class AsyncCursor(object):
+    """
+    Asynchronous wrapper around a MongoDB cursor.
+
+    The cursor can be iterated over using `async for`, in which case
+    documents are fetched from the executor in batches. Awaiting the
+    cursor itself returns all documents as a list.
+
+    Parameters
+    ----------
+    connection : AsyncConnection
+        The connection in which to run blocking calls.
+    cursor : MongoDB Cursor
+        The cursor to wrap.
+    batch_size : int, optional, default 100
+        The number of documents fetched in a single executor call.
+
+    """
+
+    def __init__(self, connection, cursor, batch_size=100):
+        """Init method."""
+        self.connection = connection
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self._buffer = []
+        self._exhausted = False
+
+    def _fetch(self):
+        """Fetch the next batch of documents. Runs in the executor."""
+        batch = []
+        for doc in self.cursor:
+            batch.append(doc)
+            if len(batch) == self.batch_size:
+                break
+        return batch
+
+    def __aiter__(self):
+        """Return self, as the cursor is its own iterator."""
+        return self
+
+    async def __anext__(self):
+        """Get the next document."""
+        if not self._buffer:
+            if self._exhausted:
+                raise StopAsyncIteration
+            self._buffer = await self.connection.run(self._fetch)
+            self._buffer.reverse()
+            if len(self._buffer) < self.batch_size:
+                self._exhausted = True
+            if not self._buffer:
+                raise StopAsyncIteration
+        return self._buffer.pop()
+
+    async def to_list(self):
+        """
+        Get all remaining documents.
+
+        Returns
+        -------
+        documents : list
+            A list of documents.
+
+        """
+        return [doc async for doc in self]
+
+    def __await__(self):
+        """Awaiting the cursor is equivalent to awaiting `to_list`."""
+        return self.to_list().__await__()
+
+
+class AsyncTable(object):
+    """
+    Base class for all asynchronous Table classes.
+
+    Wraps a blocking table, and exposes the same methods as coroutines.
+
+    Parameters
+    ----------
+    connection : AsyncConnection
+        A humumls.aio.AsyncConnection instance which is used to connect
+        to the mongoDB.
+    table : Table
+        The blocking table to wrap.
+
+    """
+
+    def __init__(self, connection, table):
+        """Init method."""
+        self.connection = connection
+        self.table = table
+        self.classname = table.classname
+
+    async def get(self, key):
+        """
+        Retrieve a single record by its primary key.
+
+        Asynchronous equivalent of `Table.__getitem__`.
+        """
+        return await self.connection.run(self.table.__getitem__, key)
+
+    def retrieve(self, query, filt=()):
+        """
+        Retrieve items from the collection.
+
+        See `Table.retrieve`. The cursor is only created here, so this
+        does not block.
+
+        Returns
+        -------
+        cursor : AsyncCursor
+            A cursor which can be awaited, or iterated over.
+
+        """
+        return AsyncCursor(self.connection, self.table.retrieve(query, filt))
+
+    async def retrieve_one(self, query=(), filt=()):
+        """Retrieve a single item. See `Table.retrieve_one`."""
+        return await self.connection.run(self.table.retrieve_one,
+                                         query,
+                                         filt)
+
+    def bunch(self, ids, filt=(), orq=True):
+        """
+        Return a bunch of items based on their primary keys.
+
+        See `Table.bunch`.
+
+        Returns
+        -------
+        cursor : AsyncCursor
+            A cursor which can be awaited, or iterated over.
+
+        """
+        return AsyncCursor(self.connection,
+                           self.table.bunch(ids, filt, orq))
+
+    async def scan(self,
+                   query=(),
+                   filt=(),
+                   batch_size=1000,
+                   lower=None,
+                   upper=None):
+        """
+        Scan the collection in batches. See `Table.scan`.
+
+        Returns
+        -------
+        batches : async generator
+            An asynchronous generator over lists of items.
+
+        """
+        batches = self.table.scan(query, filt, batch_size, lower, upper)
+        while True:
+            batch = await self.connection.run(next, batches, None)
+            if batch is None:
+                return
+            yield batch
+
+    async def partitions(self, num):
+        """Split the primary key space into ranges. See `Table.partitions`."""
+        return await self.connection.run(self.table.partitions, num)
+
+
+class AsyncString(AsyncTable):
+    """Asynchronous connection to the String collection."""
+
+    def __init__(self, connection):
+        """Init method."""
+        super(AsyncString, self).__init__(connection,
+                                          String(connection.connection))
+
+    async def surface(self, ids, lower=True):
+        """Retrieve the surface form of string ids. See `String.surface`."""
+        return await self.connection.run(self.table.surface, ids, lower)
+
+    async def cui(self, surface):
+        """Retrieve the cuis of a surface form. See `String.cui`."""
+        return await self.connection.run(self.table.cui, surface)
+
+
+class AsyncConcept(AsyncTable):
+    """Asynchronous connection to the Concept collection."""
+
+    def __init__(self, connection):
+        """Init method."""
+        super(AsyncConcept, self).__init__(connection,
+                                           Concept(connection.connection))
+
+    async def all_definitions(self):
+        """Get all concepts with definitions. See `Concept.all_definitions`."""
+        return await self.connection.run(self.table.all_definitions)
+
+    async def bunch_definitions(self, cuis):
+        """Get definitions of concepts. See `Concept.bunch_definitions`."""
+        return await self.connection.run(self.table.bunch_definitions, cuis)
+
+    async def one_definition(self, cui):
+        """Get definitions of a concept. See `Concept.one_definition`."""
+        return await self.connection.run(self.table.one_definition, cui)
+
+    async def preferred(self, cui):
+        """Get the preferred term of a concept. See `Concept.preferred`."""
+        return await self.connection.run(self.table.preferred, cui)
+
+    async def synonym(self, cui):
+        """Get the synonyms of a concept. See `Concept.synonym`."""
+        return await self.connection.run(self.table.synonym, cui)
+
+    async def words(self, cui):
+        """Get all words of a concept. See `Concept.words`."""
+        return await self.connection.run(self.table.words, cui)
+
+    async def children(self, cui):
+        """Get the children of a concept. See `Concept.children`."""
+        return await self.connection.run(self.table.children, cui)
+
+
+class AsyncTerm(AsyncTable):
+    """Asynchronous connection to the Term collection."""
+
+    def __init__(self, connection):
+        """Init method."""
+        super(AsyncTerm, self).__init__(connection,
+                                        Term(connection.connection))
+
+
+class AsyncDb(object):
+    """
+    Asynchronous variant of Db.
+
+    Independent lookups are issued concurrently using `asyncio.gather`.
+
+    Parameters
+    ----------
+    name : string
+        The name of the database.
+    hostname : string
+        The hostname.
+    port : int
+        The port to connect to.
+    executor : concurrent.futures.Executor, optional, default None
+        The executor in which blocking calls are run.
+    options
+        Additional client options, see `Connection`.
+
+    """
+
+    def __init__(self,
+                 name="umls",
+                 hostname="localhost",
+                 port=27017,
+                 executor=None,
+                 **options):
+        """Init method."""
+        self._connection = AsyncConnection(name,
+                                           hostname,
+                                           port,
+                                           executor,
+                                           **options)
+
+        self.string = AsyncString(self._connection)
+        self.term = AsyncTerm(self._connection)
+        self.concept = AsyncConcept(self._connection)
+
+    async def concepts_string(self, string):
+        """Get all concept that correspond to a string. See `Db`."""
+        concepts = await self.string.cui(string)
+        if not concepts:
+            return []
+
+        return await self.concept.bunch(concepts)
+
+    async def definitions(self, string):
+        """Get all definitions given a string. See `Db`."""
+        string_obj = await self.string.retrieve_one({"string": string},
+                                                    {"_id": 0, "cui": 1})
+        if not string_obj:
+            return []
+
+        return await self.concept.bunch_definitions(string_obj["cui"])
+
+    async def definitions_terms(self, string, relations=()):
+        """Get all definitions + preferred terms for a string. See `Db`."""
+        cuis = await self.string.cui(string)
+        if not cuis:
+            return []
+        return await self.definitions_terms_cui(cuis, relations)
+
+    async def _preferred_surface(self, lui):
+        """Get the surface forms of a term."""
+        term = await self.term.get(lui)
+        return await self.string.surface(term["sui"])
+
+    async def definitions_terms_cui(self,
+                                    cuis,
+                                    include_synonyms=(),
+                                    include_term=True):
+        """
+        Get the definitions and terms for concepts given their CUIs.
+
+        See `Db.definitions_terms_cui`. The lookups of synonyms and
+        preferred terms of all concepts are done concurrently.
+        """
+        filt = {"_id": 1, "definition": 1, "preferred": 1, "rel": 1}
+        concepts = await self.concept.retrieve({"_id": {"$in": list(cuis)},
+                                                "definition":
+                                                {"$exists": True}},
+                                               filt)
+
+        output = defaultdict(set)
+        keys = []
+        lookups = []
+        for c in concepts:
+            output[c["_id"]].update(c["definition"])
+            for syn in include_synonyms:
+                try:
+                    related = c["rel"][syn]
+                except KeyError:
+                    continue
+                keys.append((c["_id"], True))
+                lookups.append(self.definitions_terms_cui(related,
+                                                          (),
+                                                          include_term))
+            if include_term and "preferred" in c:
+                keys.append((c["_id"], False))
+                lookups.append(self._preferred_surface(c["preferred"]))
+
+        results = await asyncio.gather(*lookups)
+        for (cui, is_synonym), result in zip(keys, results):
+            if is_synonym:
+                result = chain.from_iterable(result.values())
+            output[cui].update(result)
+
+        return {k: list(v) for k, v in output.items()}
+
+    async def get_child_words(self, string):
+        """Get all words which are children of a word. See `Db`."""
+        cuis = await self.string.cui(string)
+        if not cuis:
+            return []
+        concepts = await self.concept.bunch(cuis, {"rel": 1})
+        children = [x.get('rel', {}).get('child', []) for x in concepts]
+        children = list(chain.from_iterable(children))
+        if not children:
+            return []
+
+        concepts = await self.concept.bunch(children, {"sui": 1})
+        children_suis = [x['sui'] for x in concepts]
+        return await self.string.surface(
+            list(chain.from_iterable(children_suis)))
+
+    async def get_all_children(self, cui):
+        """
+        Recursively get all children of a cui.
+
+        Unlike `Db.get_all_children`, the children of all concepts at the
+        same depth are retrieved in a single query, so the cuis are
+        returned in breadth-first order. Concepts which are not in the
+        database are treated as leaves.
+        """
+        cuis = [cui]
+        frontier = [cui]
+        while frontier:
+            concepts = await self.concept.bunch(frontier,
+                                                {"rel": 1},
+                                                orq=False)
+            concepts = {c["_id"]: c for c in concepts}
+            frontier = list(chain.from_iterable(
+                concepts.get(x, {}).get('rel', {}).get('child', [])
+                for x in frontier))
+            cuis.extend(frontier)
+        return cuis
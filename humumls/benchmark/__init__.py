@@ -0,0 +1,10 @@
+"""
+Reproducible benchmarks for createdb and the query classes.
+
+Run as `python -m humumls.benchmark`, see `python -m humumls.benchmark -h`.
+"""
+from .synthetic import generate
+from .ingest import benchmark_ingest
+from .query import benchmark_queries
+
+__all__ = ["generate", "benchmark_ingest", "benchmark_queries"]
@@ -0,0 +1,186 @@
+"""Command line interface for the benchmarks."""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ..connection import register_client
+from ..db import Db
+from .ingest import benchmark_ingest
+from .query import benchmark_queries
+from .synthetic import generate
+
+
+# The hostname under which the in-process stand-in is registered.
+STANDIN = "mongomock"
+
+HEADER = "{:<32}{:>10}{:>12}{:>14}"
+
+
+def _commit():
+    """Get the git commit of the working directory, if any."""
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("ascii").strip()
+
+
+def _parse_languages(value):
+    """Parse a language mix such as ENG:.8,DUT:.2."""
+    languages = {}
+    for item in value.split(","):
+        language, _, weight = item.partition(":")
+        languages[language.upper()] = float(weight or 1)
+    return languages
+
+
+def compare(old, new):
+    """
+    Compare two result files.
+
+    Parameters
+    ----------
+    old : dict
+        The results of the baseline.
+    new : dict
+        The results to compare to the baseline.
+
+    Returns
+    -------
+    rows : list of tuples
+        (benchmark, old seconds, new seconds, ratio) tuples. For ingestion
+        phases, the seconds are wall time, for queries the mean latency.
+
+    """
+    def flatten(results):
+        times = {}
+        for m in results.get("ingest", []):
+            times["ingest." + m["phase"]] = m["wall"]
+        for name, summary in results.get("query", {}).items():
+            if summary.get("calls"):
+                times["query." + name] = summary["mean"]
+        return times
+
+    old, new = flatten(old), flatten(new)
+    return [(k, old[k], new[k], new[k] / old[k] if old[k] else None)
+            for k in sorted(set(old) & set(new))]
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark createdb and queries on synthetic data.")
+    parser.add_argument("--concepts", type=int, default=10000,
+                        help="The number of synthetic concepts.")
+    parser.add_argument("--terms-per-concept", type=int, default=3)
+    parser.add_argument("--languages", default="ENG:.8,DUT:.2",
+                        help="The language mix, e.g. ENG:.8,DUT:.2")
+    parser.add_argument("--relation-density", type=float, default=2.)
+    parser.add_argument("--definition-rate", type=float, default=.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metadir", default=None,
+                        help="Where to write the RRF files. By default, a "
+                             "temporary directory is used and removed.")
+    parser.add_argument("--backend", choices=("mongod", STANDIN),
+                        default="mongod",
+                        help="Use a running mongod, or mongomock in-process.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--dbname", default="humumls_benchmark",
+                        help="The database to use. It is overwritten.")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="The number of calls per query.")
+    parser.add_argument("--output", default=None,
+                        help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None,
+                        help="A previous JSON result file to compare to.")
+    args = parser.parse_args(argv)
+
+    languages = _parse_languages(args.languages)
+
+    host, port = args.host, args.port
+    if args.backend == STANDIN:
+        try:
+            import mongomock
+        except ImportError:
+            parser.error("The {} backend requires mongomock.".format(STANDIN))
+        host, port = STANDIN, 0
+        register_client(mongomock.MongoClient(), host, port)
+
+    metadir = args.metadir or tempfile.mkdtemp(prefix="humumls")
+    try:
+        start = time.perf_counter()
+        counts = generate(metadir,
+                          num_concepts=args.concepts,
+                          terms_per_concept=args.terms_per_concept,
+                          languages=languages,
+                          definition_rate=args.definition_rate,
+                          relation_density=args.relation_density,
+                          seed=args.seed)
+        generated = time.perf_counter() - start
+
+        db = Db(args.dbname, host, port)
+        ingest = benchmark_ingest(metadir, languages, db._connection.db)
+    finally:
+        if args.metadir is None:
+            shutil.rmtree(metadir)
+
+    query = benchmark_queries(db, num=args.queries, seed=args.seed)
+
+    results = {"commit": _commit(),
+               "python": sys.version,
+               "platform": platform.platform(),
+               "backend": args.backend,
+               "parameters": {"concepts": args.concepts,
+                              "terms_per_concept": args.terms_per_concept,
+                              "languages": languages,
+                              "relation_density": args.relation_density,
+                              "definition_rate": args.definition_rate,
+                              "seed": args.seed,
+                              "queries": args.queries},
+               "lines": counts,
+               "generate": generated,
+               "ingest": ingest,
+               "query": query}
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    print(HEADER.format("phase", "wall", "cpu", "items/s"))
+    for m in ingest:
+        rate = m["records_per_second"] or m["documents_per_second"]
+        print("{:<32}{:>10.3f}{:>12.3f}{:>14.0f}".format(
+            m["phase"], m["wall"], m["cpu"], rate))
+    print()
+    print(HEADER.format("query", "mean ms", "p95 ms", "calls/s"))
+    for name, s in sorted(query.items()):
+        if not s["calls"]:
+            continue
+        print("{:<32}{:>10.3f}{:>12.3f}{:>14.0f}".format(
+            name, s["mean"] * 1000, s["p95"] * 1000, s["calls_per_second"]))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        print(HEADER.format("benchmark", "old", "new", "new/old"))
+        for name, old, new, ratio in compare(baseline, results):
+            print("{:<32}{:>10.4f}{:>12.4f}{:>14}".format(
+                name, old, new, "{:.2f}".format(ratio) if ratio else "-"))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Benchmarks for the phases of createdb."""
+import langid
+
+from ..buildmetrics import BuildMetrics
+from ..dump import create_indexes
+from ..tablecreator import (_count_lines,
+                            _create_strings,
+                            _create_terms,
+                            _create_concepts)
+
+
+def benchmark_ingest(metadir,
+                     languages=(),
+                     db=None,
+                     preprocessor=lambda x: x,
+                     prefetch=None,
+                     metrics=None):
+    """
+    Run every phase of createdb, and measure it.
+
+    Unlike createdb, the documents of all collections are created before
+    any of them are inserted, so that parsing and inserting can be
+    compared directly. Counting the lines and loading the language model
+    of langid are measured as separate phases, so that they are not
+    part of the parsing phases.
+
+    Parameters
+    ----------
+    metadir : string
+        The path to the directory which contains the RRF files.
+    languages : list of string, optional, default ()
+        The languages to extract, in UMLS format.
+    db : MongoDB.DB, optional, default None
+        The database into which to insert the documents. The term, string
+        and concept collections are dropped first. If this is None, the
+        documents are not inserted.
+    preprocessor : function, optional, default identity
+        The preprocessor for definitions.
+    prefetch : string, optional, default None
+        Whether to decompress the RRF files in the background, see
+        `humumls.rrf.read_rrf`.
+    metrics : BuildMetrics, optional, default None
+        The metrics to use, e.g. to add sinks or profile a phase.
+
+    Returns
+    -------
+    measurements : list of dict
+        The measurements of all phases, in the order they were run. See
+        `humumls.buildmetrics.BuildMetrics`.
+
+    """
+    if metrics is None:
+        metrics = BuildMetrics()
+    languages = set(languages)
+
+    _count_lines(metadir,
+                 ("term", "string", "concept"),
+                 True,
+                 True,
+                 True,
+                 metrics)
+    # The language model is loaded on first use, which would otherwise be
+    # part of the mrdef phase, and dominate it for small inputs.
+    with metrics.phase("langid_load"):
+        langid.classify("")
+
+    with metrics.phase("mrconso_terms") as stats:
+        terms = _create_terms(metadir, languages, prefetch, stats)
+    with metrics.phase("mrconso_strings") as stats:
+        strings = _create_strings(metadir, languages, prefetch, stats)
+    concepts = _create_concepts(metadir,
+                                True,
+                                True,
+                                True,
+                                languages,
+                                preprocessor,
+                                prefetch,
+                                metrics)
+
+    if db is not None:
+        for name, documents in (("term", terms),
+                                ("string", strings),
+                                ("concept", concepts)):
+            db.drop_collection(name)
+            with metrics.phase("insert_{}".format(name)) as stats:
+                db.get_collection(name).insert_many(documents)
+                stats.documents = len(documents)
+        with metrics.phase("index"):
+            create_indexes(db)
+
+    return metrics.phases
@@ -0,0 +1,95 @@
+"""Benchmarks for the query paths of Db and Table."""
+import random
+import time
+
+
+def _sample(rng, table, size, field):
+    """Get a seeded random sample of the values of a field."""
+    values = [x[field]
+              for batch in table.scan(filt={field: 1}, batch_size=10000)
+              for x in batch]
+    return rng.sample(values, min(size, len(values)))
+
+
+def summarize(latencies):
+    """
+    Summarize a list of latencies.
+
+    Parameters
+    ----------
+    latencies : list of float
+        The latencies, in seconds.
+
+    Returns
+    -------
+    summary : dict
+        The number of calls, the total time, and the mean, median, 95th
+        and 99th percentile and maximum latency.
+
+    """
+    if not latencies:
+        return {"calls": 0}
+    latencies = sorted(latencies)
+    total = sum(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    return {"calls": len(latencies),
+            "total": total,
+            "calls_per_second": len(latencies) / total if total else None,
+            "mean": total / len(latencies),
+            "p50": percentile(.5),
+            "p95": percentile(.95),
+            "p99": percentile(.99),
+            "max": latencies[-1]}
+
+
+def _time(func, arguments):
+    """Call func once for every argument, and time every call."""
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        func(argument)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def benchmark_queries(db, num=200, batch_size=50, seed=0):
+    """
+    Measure the latency of common queries on a random sample of records.
+
+    Parameters
+    ----------
+    db : Db
+        The database to query.
+    num : int, optional, default 200
+        The number of calls per query.
+    batch_size : int, optional, default 50
+        The number of concept ids passed to bulk queries.
+    seed : int, optional, default 0
+        The seed used to select the records.
+
+    Returns
+    -------
+    results : dict
+        A dictionary mapping query names to latency summaries, see
+        `summarize`.
+
+    """
+    rng = random.Random(seed)
+
+    cuis = _sample(rng, db.concept, num, "_id")
+    strings = _sample(rng, db.string, num, "string")
+    batches = [rng.sample(cuis, min(batch_size, len(cuis)))
+               for _ in range(num)]
+
+    return {"concept.bunch":
+            _time(lambda x: list(db.concept.bunch(x, orq=False)), batches),
+            "concept.bunch_or":
+            _time(lambda x: list(db.concept.bunch(x)), batches),
+            "string.cui": _time(db.string.cui, strings),
+            "get_all_children": _time(db.get_all_children, cuis),
+            "definitions_terms_cui":
+            _time(db.definitions_terms_cui, batches),
+            "concepts_string": _time(db.concepts_string, strings)}
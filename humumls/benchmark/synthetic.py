@@ -0,0 +1,171 @@
+"""Generate synthetic RRF files with the same layout as UMLS."""
+import os
+import random
+from io import open
+
+
+# Words used to build strings and definitions. Definitions are tagged with
+# langid, so every language needs enough real words to be recognized.
+WORDS = {"ENG": ("the of and a disease chronic acute patient heart lung "
+                 "blood cell cells tissue which is caused by in with "
+                 "pain infection syndrome disorder treatment of the "
+                 "body growth abnormal condition that affects").split(),
+         "DUT": ("de het een en van ziekte chronische acute patiënt hart "
+                 "long bloed cel cellen weefsel die wordt veroorzaakt "
+                 "door in met pijn infectie syndroom aandoening "
+                 "behandeling lichaam groei afwijkende toestand").split(),
+         "FRE": ("le la les un une et de du maladie chronique aiguë "
+                 "patient coeur poumon sang cellule tissu qui est causée "
+                 "par dans avec douleur infection syndrome trouble "
+                 "traitement corps croissance anormale").split(),
+         "GER": ("der die das ein eine und von mit Krankheit chronische "
+                 "akute Patient Herz Lunge Blut Zelle Gewebe welche wird "
+                 "verursacht durch im Schmerz Infektion Syndrom Störung "
+                 "Behandlung Körper Wachstum").split(),
+         "SPA": ("el la los las un una y de del enfermedad crónica aguda "
+                 "paciente corazón pulmón sangre célula tejido que es "
+                 "causada por en con dolor infección síndrome trastorno "
+                 "tratamiento cuerpo crecimiento").split()}
+
+SEMANTICTYPES = (("T047", "B2.2.1.2.1", "Disease or Syndrome"),
+                 ("T191", "B2.2.1.2.1.2", "Neoplastic Process"),
+                 ("T023", "A1.2.3.1", "Body Part, Organ, or Organ Component"),
+                 ("T121", "A1.4.1.1.1", "Pharmacologic Substance"),
+                 ("T184", "A2.2.2", "Sign or Symptom"))
+
+# Relations other than the parent/child hierarchy.
+RELATIONS = ("RO", "RB", "RN", "SY", "RQ", "SIB")
+
+
+def _choose_language(rng, languages):
+    """Choose a language according to the language mix."""
+    return rng.choices(list(languages), weights=list(languages.values()))[0]
+
+
+def _sentence(rng, language, length):
+    """Create a sequence of random words in a language."""
+    return " ".join(rng.choice(WORDS[language]) for _ in range(length))
+
+
+def generate(outdir,
+             num_concepts=1000,
+             terms_per_concept=3,
+             languages=None,
+             ambiguity=.05,
+             definition_rate=.5,
+             relation_density=2.,
+             seed=0):
+    """
+    Write synthetic MRCONSO, MRDEF, MRREL and MRSTY files.
+
+    The concepts form a single tree through PAR and CHD relations, so
+    recursive queries such as `Db.get_all_children` terminate. Other
+    relations are added between random concepts.
+
+    Parameters
+    ----------
+    outdir : string
+        The directory in which to write the RRF files.
+    num_concepts : int, optional, default 1000
+        The number of concepts.
+    terms_per_concept : int, optional, default 3
+        The average number of terms per concept.
+    languages : dict, optional, default None
+        A dictionary mapping UMLS language codes to their relative
+        frequency. If this is None, 80% of the terms and definitions are
+        English and 20% are Dutch.
+    ambiguity : float, optional, default .05
+        The probability that a term reuses an existing string, so that the
+        string refers to multiple concepts.
+    definition_rate : float, optional, default .5
+        The probability that a concept has a definition.
+    relation_density : float, optional, default 2.
+        The average number of relations per concept, in addition to the
+        parent/child hierarchy.
+    seed : int, optional, default 0
+        The random seed. The same seed gives the same files.
+
+    Returns
+    -------
+    counts : dict
+        The number of lines written to each file.
+
+    """
+    if languages is None:
+        languages = {"ENG": .8, "DUT": .2}
+    unknown = set(languages) - set(WORDS)
+    if unknown:
+        raise ValueError("No words for languages {}".format(sorted(unknown)))
+
+    rng = random.Random(seed)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    counts = dict.fromkeys(("MRCONSO", "MRDEF", "MRREL", "MRSTY"), 0)
+    strings = {language: [] for language in languages}
+    num_luis = 0
+    num_auis = 0
+
+    def path(name):
+        return os.path.join(outdir, "{}.RRF".format(name))
+
+    with open(path("MRCONSO"), "w", encoding="utf-8") as mrconso, \
+            open(path("MRDEF"), "w", encoding="utf-8") as mrdef, \
+            open(path("MRSTY"), "w", encoding="utf-8") as mrsty:
+
+        for idx in range(num_concepts):
+            cui = "C{:07d}".format(idx)
+
+            num_terms = rng.randint(1, 2 * terms_per_concept - 1)
+            for term in range(num_terms):
+                language = _choose_language(rng, languages)
+                num_luis += 1
+                num_auis += 1
+                lui = "L{:07d}".format(num_luis)
+                aui = "A{:07d}".format(num_auis)
+
+                if strings[language] and rng.random() < ambiguity:
+                    sui, string = rng.choice(strings[language])
+                else:
+                    sui = "S{:07d}".format(sum(map(len, strings.values())))
+                    string = _sentence(rng, language, rng.randint(1, 4))
+                    strings[language].append((sui, string))
+
+                fields = [cui, language, "P" if term == 0 else "S", lui,
+                          "PF", sui, "Y", aui, "", "", "", "SYN", "PT",
+                          cui, string, "0", "N", ""]
+                mrconso.write("|".join(fields) + "|\n")
+                counts["MRCONSO"] += 1
+
+            if rng.random() < definition_rate:
+                for _ in range(rng.randint(1, 2)):
+                    language = _choose_language(rng, languages)
+                    definition = _sentence(rng, language, rng.randint(8, 20))
+                    fields = [cui, "", "", "", "SYN", definition, "N", ""]
+                    mrdef.write("|".join(fields) + "|\n")
+                    counts["MRDEF"] += 1
+
+            tui, stn, sty = rng.choice(SEMANTICTYPES)
+            mrsty.write("|".join([cui, tui, stn, sty, "", ""]) + "|\n")
+            counts["MRSTY"] += 1
+
+    with open(path("MRREL"), "w", encoding="utf-8") as mrrel:
+
+        def relation(cui1, rel, cui2):
+            fields = [cui1, "", "CUI", rel, cui2, "", "CUI", "", "", "",
+                      "SYN", "SYN", "", "", "N", ""]
+            mrrel.write("|".join(fields) + "|\n")
+            counts["MRREL"] += 1
+
+        for idx in range(1, num_concepts):
+            child = "C{:07d}".format(idx)
+            parent = "C{:07d}".format(rng.randrange(idx))
+            relation(child, "CHD", parent)
+            relation(parent, "PAR", child)
+
+        for _ in range(int(relation_density * num_concepts)):
+            cui1 = "C{:07d}".format(rng.randrange(num_concepts))
+            cui2 = "C{:07d}".format(rng.randrange(num_concepts))
+            relation(cui1, rng.choice(RELATIONS), cui2)
+
+    return counts
@@ -0,0 +1,299 @@
+"""Per-phase metrics and profiling for createdb."""
+import collections
+import json
+import logging
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from io import open
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    Get the peak resident set size of this process in bytes.
+
+    Returns None on platforms without the resource module.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes everywhere else.
+    if sys.platform != "darwin":
+        peak *= 1024
+    return peak
+
+
+class PhaseStats(object):
+    """
+    Counters of a single phase, which are updated while the phase runs.
+
+    Attributes
+    ----------
+    name : string
+        The name of the phase.
+    records : int
+        The number of input records, i.e. lines, read.
+    bytes_read : int
+        The number of decompressed bytes read.
+    documents : int
+        The number of documents written.
+
+    """
+
+    def __init__(self, name):
+        """Init method."""
+        self.name = name
+        self.records = 0
+        self.bytes_read = 0
+        self.documents = 0
+
+
+class LoggerSink(object):
+    """
+    Sink which logs every phase.
+
+    Parameters
+    ----------
+    logger : logging.Logger, optional, default None
+        The logger to use. If this is None, the humumls.build logger is
+        used.
+    level : int, optional, default logging.INFO
+        The level at which to log.
+
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """Init method."""
+        self.logger = logger or logging.getLogger("humumls.build")
+        self.level = level
+
+    def __call__(self, result):
+        """Log a single phase."""
+        self.logger.log(self.level,
+                        "%s: %.3fs wall, %.3fs cpu, %d records, "
+                        "%d bytes, %d documents",
+                        result["phase"],
+                        result["wall"],
+                        result["cpu"],
+                        result["records"],
+                        result["bytes_read"],
+                        result["documents"])
+
+
+class JsonSink(object):
+    """
+    Sink which appends every phase to a file as a line of JSON.
+
+    Parameters
+    ----------
+    path : string
+        The path of the file.
+
+    """
+
+    def __init__(self, path):
+        """Init method."""
+        self.path = path
+
+    def __call__(self, result):
+        """Write a single phase."""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+class SamplingProfiler(object):
+    """
+    Statistical profiler which samples the stack of the main thread.
+
+    Uses SIGPROF, so it only works on Unix, and only in the main thread.
+    The samples are written as collapsed stacks, one "frame;frame count"
+    line per unique stack, which can be read by flamegraph.pl and
+    speedscope.
+
+    Parameters
+    ----------
+    interval : float, optional, default .005
+        The interval between samples, in seconds of CPU time.
+
+    """
+
+    def __init__(self, interval=.005):
+        """Init method."""
+        if not hasattr(signal, "SIGPROF"):
+            raise ValueError("Sampling is not supported on this platform.")
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._previous = None
+
+    def _sample(self, signum, frame):
+        """Record the current stack."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{} ({}:{})".format(code.co_name,
+                                             code.co_filename,
+                                             code.co_firstlineno))
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Start sampling."""
+        if threading.current_thread() is not threading.main_thread():
+            raise ValueError("The profiler can only run in the main thread.")
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stop sampling."""
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def write(self, path):
+        """Write the samples as collapsed stacks."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(u"{} {}\n".format(stack, count))
+
+
+class BuildMetrics(object):
+    """
+    Collects metrics of the phases of createdb.
+
+    For every phase, the wall and CPU time, the number of records and
+    bytes read, the number of documents written, and the peak memory are
+    recorded and passed to the sinks.
+
+    Parameters
+    ----------
+    sinks : list of callables, optional, default ()
+        Functions which are called with the results of each phase, as a
+        dictionary. See `LoggerSink` and `JsonSink`, but any callable can
+        be used.
+    trace_memory : bool, optional, default False
+        If this is True, the peak memory is the peak of memory allocated
+        by Python during the phase, measured with tracemalloc. This is
+        exact, but slows down the build. Otherwise, it is the peak RSS
+        high-water mark of the whole process after the phase.
+    profile : string, optional, default None
+        The name of a phase to profile with a `SamplingProfiler`. Only
+        phases measured with `phase` in the main thread can be profiled,
+        so this does not apply to phases added with `add`, such as the
+        insert phases of the pipelined build.
+    profile_output : string, optional, default "profile.txt"
+        Where to write the samples of the profiled phase.
+
+    Attributes
+    ----------
+    phases : list of dict
+        The results of all phases, in the order they finished.
+
+    """
+
+    def __init__(self,
+                 sinks=(),
+                 trace_memory=False,
+                 profile=None,
+                 profile_output="profile.txt"):
+        """Init method."""
+        self.sinks = list(sinks)
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.profile_output = profile_output
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, thread_cpu=False):
+        """
+        Measure a phase.
+
+        Parameters
+        ----------
+        name : string
+            The name of the phase.
+        thread_cpu : bool, optional, default False
+            If this is False, the CPU time of the whole process is
+            measured, including that of other threads. Otherwise, only the
+            CPU time of the calling thread is measured, e.g. because the
+            other threads are measured separately.
+
+        Yields
+        ------
+        stats : PhaseStats
+            The counters of the phase, which should be updated by the code
+            inside the block.
+
+        """
+        stats = PhaseStats(name)
+
+        profiler = None
+        if name == self.profile:
+            profiler = SamplingProfiler()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+
+        clock = time.thread_time if thread_cpu else time.process_time
+        wall = time.perf_counter()
+        cpu = clock()
+        if profiler:
+            profiler.start()
+        try:
+            yield stats
+        finally:
+            if profiler:
+                profiler.stop()
+            wall = time.perf_counter() - wall
+            cpu = clock() - cpu
+
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            else:
+                peak = peak_rss()
+
+            if profiler:
+                profiler.write(self.profile_output)
+
+        self.add(stats, wall, cpu, peak)
+
+    def add(self, stats, wall, cpu, peak=None):
+        """
+        Add a phase which was measured elsewhere, e.g. in another thread.
+
+        These phases are never profiled, even if their name is profile.
+
+        Parameters
+        ----------
+        stats : PhaseStats
+            The counters of the phase.
+        wall : float
+            The wall time of the phase, in seconds.
+        cpu : float
+            The CPU time of the phase, in seconds.
+        peak : int, optional, default None
+            The peak memory of the phase, in bytes.
+
+        """
+        result = {"phase": stats.name,
+                  "wall": wall,
+                  "cpu": cpu,
+                  "records": stats.records,
+                  "records_per_second": stats.records / wall if wall else 0,
+                  "bytes_read": stats.bytes_read,
+                  "documents": stats.documents,
+                  "documents_per_second":
+                  stats.documents / wall if wall else 0,
+                  "peak_memory": peak}
+        with self._lock:
+            self.phases.append(result)
+            for sink in self.sinks:
+                sink(result)
@@ -1,7 +1,124 @@
 """Connection wrapper around mongoclient."""
+import os
+import threading
+
 from pymongo import MongoClient
 
 
+_CLIENTS = {}
+_LOCK = threading.Lock()
+_PID = os.getpid()
+
+
+def _hashable(value):
+    """Turn a client option into something which can be used as a key."""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _reset_after_fork():
+    """Forget all clients inherited from the parent process."""
+    global _LOCK, _PID
+    _LOCK = threading.Lock()
+    _PID = os.getpid()
+    _CLIENTS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(host, port, options):
+    """Get the registry key of a client."""
+    options.setdefault("connect", False)
+    return (host,
+            port,
+            tuple(sorted((k, _hashable(v)) for k, v in options.items())))
+
+
+def get_client(host="localhost", port=27017, **options):
+    """
+    Get a MongoClient from the process-wide registry.
+
+    Each MongoClient has its own connection pool and monitoring threads,
+    so clients are created once per host, port and set of options, and
+    shared by all connections afterwards.
+
+    MongoClients are not fork-safe. Clients inherited from a parent
+    process are never returned: a new client is created in the child
+    the first time it is requested.
+
+    Parameters
+    ----------
+    host : string, optional, default "localhost"
+        The hostname, or a mongodb:// URI.
+    port : int, optional, default 27017
+        The port to connect to.
+    options
+        Keyword arguments passed to MongoClient. Clients are created with
+        connect=False unless specified otherwise, so that they do not
+        connect before a fork.
+
+    Returns
+    -------
+    client : MongoClient
+        The shared client.
+
+    """
+    key = _key(host, port, options)
+
+    with _LOCK:
+        if _PID != os.getpid():
+            _reset_after_fork()
+        try:
+            return _CLIENTS[key]
+        except KeyError:
+            client = MongoClient(host=host, port=port, **options)
+            _CLIENTS[key] = client
+            return client
+
+
+def register_client(client, host="localhost", port=27017, **options):
+    """
+    Add a client to the registry of this process.
+
+    Connections with the same host, port and options will use this client,
+    instead of creating a new one. This can be used to pass a client which
+    is configured differently, e.g. an in-process stand-in for testing.
+    Registered clients are not inherited by forked processes.
+
+    Parameters
+    ----------
+    client : MongoClient
+        The client to register.
+    host : string, optional, default "localhost"
+        The hostname under which to register the client.
+    port : int, optional, default 27017
+        The port under which to register the client.
+    options
+        The client options under which to register the client.
+
+    """
+    key = _key(host, port, options)
+
+    with _LOCK:
+        if _PID != os.getpid():
+            _reset_after_fork()
+        _CLIENTS[key] = client
+
+
+def close_clients():
+    """Close all clients in the registry of this process."""
+    with _LOCK:
+        if _PID == os.getpid():
+            for client in _CLIENTS.values():
+                client.close()
+        _CLIENTS.clear()
+
+
 class Connection(object):
     """
     Connection class, used to pass collections to multiple Table objects.
@@ -13,14 +130,24 @@ class Connection(object):
         hostname = "localhost"
         port = 27107
 
+    Connections with the same hostname, port and options share a single
+    MongoClient, see `get_client`.
+
     Parameters
     ----------
     dbname : string
         The name of the database.
     hostname : string
-        The hostname.
+        The hostname, or a mongodb:// URI.
     port : int
         The port to connect to.
+    metrics : QueryMetrics, optional, default None
+        If this is not None, the latency of all queries through this
+        connection is recorded, see `humumls.querymetrics.QueryMetrics`.
+    options
+        Additional client options, passed to MongoClient. Useful options
+        include maxPoolSize, minPoolSize, serverSelectionTimeoutMS,
+        socketTimeoutMS, readPreference, compressors and w.
 
     Attributes
     ----------
@@ -28,10 +155,66 @@ class Connection(object):
         The initialized mongoclient.
     db : MongoDB.DB
         The specific database queried by this connection.
+    metrics : QueryMetrics or None
+        The registry to which queries are recorded.
 
     """
 
-    def __init__(self, dbname="umls", hostname="localhost", port=27017):
+    def __init__(self,
+                 dbname="umls",
+                 hostname="localhost",
+                 port=27017,
+                 metrics=None,
+                 **options):
         """Create a new connection to a specified database."""
-        self.client = MongoClient(host=hostname, port=port)
-        self.db = self.client.get_database(dbname)
+        self.dbname = dbname
+        self.hostname = hostname
+        self.port = port
+        self.metrics = metrics
+        self.options = options
+        self._pid = None
+        self._db = None
+        self._collections = {}
+
+    def _check_fork(self):
+        """Drop the database and collections if the process has forked."""
+        if self._pid != os.getpid():
+            self._db = get_client(self.hostname,
+                                  self.port,
+                                  **self.options).get_database(self.dbname)
+            self._collections = {}
+            self._pid = os.getpid()
+
+    @property
+    def client(self):
+        """The client of this process."""
+        return self.db.client
+
+    @property
+    def db(self):
+        """The database of this process."""
+        self._check_fork()
+        return self._db
+
+    def get_collection(self, name):
+        """
+        Get a collection from the database.
+
+        Parameters
+        ----------
+        name : string
+            The name of the collection.
+
+        Returns
+        -------
+        collection : MongoDB.Collection
+            The collection, bound to the client of the current process.
+
+        """
+        self._check_fork()
+        try:
+            return self._collections[name]
+        except KeyError:
+            collection = self._db.get_collection(name)
+            self._collections[name] = collection
+            return collection
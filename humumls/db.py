@@ -1,22 +1,68 @@
 """Example of aggregate queries."""
-from collections import defaultdict
-from itertools import chain
+import multiprocessing
+from collections import defaultdict, deque
+from itertools import chain, islice
 
 from humumls.connection import Connection
 from humumls import String, Term, Concept
+from humumls.table import with_id
+from humumls.querymetrics import timed
 
 
-class Db(object):
-    """Example class of Aggregate queries using different UMLS tables."""
+# The Db of a worker process started by Db.parallel_map.
+_WORKER_DB = None
+
+
+def _init_worker(name, hostname, port, options):
+    """Open a separate Db in a worker process."""
+    global _WORKER_DB
+    _WORKER_DB = Db(name, hostname, port, **options)
+
+
+def _map_chunk(func, table, filt, keys):
+    """Retrieve a chunk of keys in a single query, and apply func."""
+    docs = getattr(_WORKER_DB, table).bunch(keys, with_id(filt), orq=False)
+    docs = {d["_id"]: d for d in docs}
+    if filt and not filt.get("_id", 1):
+        for d in docs.values():
+            del d["_id"]
+    return [func(k, docs.get(k)) for k in keys]
 
-    def __init__(self, name="umls", hostname="localhost", port=27017):
+
+class Db(object):
+    """
+    Example class of Aggregate queries using different UMLS tables.
+
+    Parameters
+    ----------
+    name : string
+        The name of the database.
+    hostname : string
+        The hostname, or a mongodb:// URI.
+    port : int
+        The port to connect to.
+    metrics : QueryMetrics, optional, default None
+        If this is not None, the latency of all queries and aggregates is
+        recorded, see `humumls.querymetrics.QueryMetrics`.
+    options
+        Additional client options, see `Connection`.
+
+    """
+
+    def __init__(self, name="umls", hostname="localhost", port=27017,
+                 metrics=None, **options):
         """Init method."""
-        self._connection = Connection(name, hostname, port)
+        self._connection = Connection(name,
+                                      hostname,
+                                      port,
+                                      metrics,
+                                      **options)
 
         self.string = String(self._connection)
         self.term = Term(self._connection)
         self.concept = Concept(self._connection)
 
+    @timed
     def concepts_string(self, string):
         """
         Get all concept that correspond to a string.
@@ -40,6 +86,7 @@ class Db(object):
 
         return list(self.concept.bunch(concepts))
 
+    @timed
     def definitions(self, string):
         """
         Get all definitions given a string.
@@ -66,6 +113,7 @@ class Db(object):
         # Get the definitions.
         return self.concept.bunch_definitions(string_obj["cui"])
 
+    @timed
     def definitions_terms(self, string, relations=()):
         """
         Get all definitions + preferred terms for a given string.
@@ -90,12 +138,34 @@ class Db(object):
             return []
         return self.definitions_terms_cui(cuis, relations)
 
+    @timed
     def definitions_terms_cui(self,
+                              cuis,
                               include_synonyms=(),
                               include_term=True):
-        """Get the definitions and terms for concepts given their CUIs."""
+        """
+        Get the definitions and terms for concepts given their CUIs.
+
+        Parameters
+        ----------
+        cuis : list of str
+            The concept ids for which to retrieve definitions and terms.
+        include_synonyms : list, optional, default ()
+            The types of relations to include. The definitions and terms
+            of related concepts are added to those of the concept itself.
+        include_term : bool, optional, default True
+            Whether to include the surface forms of the preferred term.
+
+        Returns
+        -------
+        concepts : dict
+            A dictionary mapping concept ids to lists of definitions and
+            terms.
+
+        """
         filt = {"_id": 1, "definition": 1, "preferred": 1, "rel": 1}
-        concepts = self.concept.retrieve({"definition": {"$exists": True}},
+        concepts = self.concept.retrieve({"_id": {"$in": list(cuis)},
+                                          "definition": {"$exists": True}},
                                          filt)
 
         output = defaultdict(set)
@@ -110,11 +180,12 @@ class Db(object):
                         synonyms = self.definitions_terms_cui(c["rel"][syn],
                                                               (),
                                                               include_term)
-                        output[c["_id"]].update(chain.from_iterable(synonyms))
+                        output[c["_id"]].update(
+                            chain.from_iterable(synonyms.values()))
                     except KeyError:
                         pass
 
-            if include_term:
+            if include_term and "preferred" in c:
 
                 term = self.term[c["preferred"]]
                 output[c["_id"]].update(self.string.surface(term["sui"]))
@@ -123,18 +194,121 @@ class Db(object):
 
         return output
 
+    @timed
     def get_child_words(self, string):
         """Get all words which are children of a word."""
-        cuis = self.string.cuis(string)
-        children = [x['rel']['child'] for x in self.concept.bunch(cuis)]
+        cuis = self.string.cui(string)
+        if not cuis:
+            return []
+        children = [x.get('rel', {}).get('child', [])
+                    for x in self.concept.bunch(cuis, {"rel": 1})]
         children = list(chain.from_iterable(children))
+        if not children:
+            return []
 
-        children_strings = [x['string'] for x in self.concept.bunch(children)]
-        return list(chain.from_iterable(children_strings))
+        children_suis = [x['sui']
+                         for x in self.concept.bunch(children, {"sui": 1})]
+        return self.string.surface(list(chain.from_iterable(children_suis)))
 
+    @timed
     def get_all_children(self, cui):
-        """Recursively get all children of a cui."""
+        """
+        Recursively get all children of a cui.
+
+        Concepts which are not in the database, e.g. because they were
+        filtered out by language, are treated as leaves.
+        """
         cuis = [cui]
-        for x in self.concept.retrieve_one(cui)['rel']['child']:
+        concept = self.concept[cui] or {}
+        for x in concept.get('rel', {}).get('child', []):
             cuis.extend(self.get_all_children(x))
         return cuis
+
+    def parallel_map(self,
+                     func,
+                     keys,
+                     workers=None,
+                     chunksize=1000,
+                     table="concept",
+                     filt=(),
+                     max_pending=None,
+                     context=None):
+        """
+        Apply a function to the records of many keys in worker processes.
+
+        Every worker opens its own Db with the same settings as this one.
+        Keys are grouped into chunks, and all records in a chunk are
+        retrieved with a single `bunch` query. The results are returned
+        in the order of the keys. Only max_pending chunks are submitted
+        at the same time, so keys can be a generator over more keys than
+        fit in memory.
+
+        Parameters
+        ----------
+        func : function
+            A function which takes a key and its record, and returns
+            a result. The record is None for keys which are not in the
+            table. Must be picklable, i.e. defined at module level.
+        keys : iterable
+            The keys for which to retrieve records, e.g. CUIs.
+        workers : int, optional, default None
+            The number of worker processes. If this is None, the number of
+            CPUs is used.
+        chunksize : int, optional, default 1000
+            The number of keys retrieved in a single query.
+        table : string, optional, default "concept"
+            The table from which to retrieve records. One of "concept",
+            "string" or "term".
+        filt : dict, optional, default ()
+            The filtering dictionary passed to `bunch`. The primary key
+            is always retrieved to match documents to keys, but removed
+            again if filt excludes it.
+        max_pending : int, optional, default None
+            The maximum number of chunks which are submitted, but whose
+            results have not been returned yet. If this is None, two
+            chunks per worker are used.
+        context : string, optional, default None
+            The multiprocessing start method. If this is None, the
+            default start method is used.
+
+        Returns
+        -------
+        results : generator
+            A generator over the results of func, in the order of keys.
+
+        """
+        if table not in ("concept", "string", "term"):
+            raise ValueError("table should be concept, string or term, "
+                             "not {}".format(table))
+        if chunksize < 1:
+            raise ValueError("chunksize should be a positive integer.")
+
+        ctx = multiprocessing.get_context(context)
+        workers = workers or ctx.cpu_count()
+        max_pending = max_pending or 2 * workers
+
+        c = self._connection
+        pool = ctx.Pool(workers,
+                        initializer=_init_worker,
+                        initargs=(c.dbname, c.hostname, c.port, c.options))
+
+        keys = iter(keys)
+        pending = deque()
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    chunk = list(islice(keys, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(pool.apply_async(_map_chunk,
+                                                    (func,
+                                                     table,
+                                                     filt,
+                                                     chunk)))
+                if not pending:
+                    break
+                for result in pending.popleft().get():
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,213 @@
+"""Dump files which can be loaded with mongorestore or mongoimport."""
+import gzip
+import os
+import shutil
+import subprocess
+from io import open
+
+from bson import BSON
+from bson.json_util import dumps
+
+from .connection import get_client
+
+
+FORMATS = ("bson", "json")
+
+# The indexes which are built after loading, per collection.
+INDEXES = {"string": ["string"]}
+
+
+def dump_path(dumpdir, dbname, collection, dumpformat="bson", compress=True):
+    """
+    Get the path of the dump file of a collection.
+
+    The layout is the same as the one used by mongodump, i.e.
+    dumpdir/dbname/collection.bson, optionally followed by .gz.
+
+    Parameters
+    ----------
+    dumpdir : string
+        The directory which contains the dumps.
+    dbname : string
+        The name of the database.
+    collection : string
+        The name of the collection.
+    dumpformat : string, optional, default "bson"
+        The format of the dump, either "bson" or "json".
+    compress : bool, optional, default True
+        Whether the dump is compressed using gzip.
+
+    Returns
+    -------
+    path : string
+        The path to the dump file.
+
+    """
+    if dumpformat not in FORMATS:
+        raise ValueError("dumpformat should be one of {}, not {}"
+                         "".format(FORMATS, dumpformat))
+    filename = "{}.{}".format(collection, dumpformat)
+    if compress:
+        filename += ".gz"
+    return os.path.join(dumpdir, dbname, filename)
+
+
+def write_dump(documents, path, dumpformat="bson", compress=True):
+    """
+    Write documents to a dump file, one at a time.
+
+    BSON dumps can be loaded with mongorestore, JSON dumps contain one
+    document in MongoDB extended JSON per line, and can be loaded with
+    mongoimport.
+
+    Parameters
+    ----------
+    documents : iterable of dict
+        The documents to write.
+    path : string
+        The path of the dump file. Directories are created if necessary.
+    dumpformat : string, optional, default "bson"
+        The format of the dump, either "bson" or "json".
+    compress : bool, optional, default True
+        Whether to compress the dump using gzip.
+
+    Returns
+    -------
+    num : int
+        The number of documents written.
+
+    """
+    if dumpformat not in FORMATS:
+        raise ValueError("dumpformat should be one of {}, not {}"
+                         "".format(FORMATS, dumpformat))
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    opener = gzip.open if compress else open
+    num = 0
+    with opener(path, "wb") as f:
+        for doc in documents:
+            if dumpformat == "bson":
+                f.write(BSON.encode(doc))
+            else:
+                f.write(dumps(doc).encode("utf-8"))
+                f.write(b"\n")
+            num += 1
+
+    return num
+
+
+def create_indexes(db):
+    """
+    Create the indexes used by the query classes.
+
+    Parameters
+    ----------
+    db : MongoDB.DB
+        The database in which to create the indexes.
+
+    """
+    for collection, fields in INDEXES.items():
+        for field in fields:
+            db.get_collection(collection).create_index(field)
+
+
+def _server_args(host, port):
+    """Get the arguments which select the server for the database tools."""
+    if str(host).startswith(("mongodb://", "mongodb+srv://")):
+        return ["--uri", host]
+    return ["--host", str(host), "--port", str(port)]
+
+
+def loaddb(dumpdir,
+           dbname="umls",
+           host="localhost",
+           port=27017,
+           dumpformat="bson",
+           compress=True,
+           overwrite=False,
+           collections=("term", "string", "concept"),
+           mongorestore="mongorestore",
+           mongoimport="mongoimport"):
+    """
+    Load dump files written by createdb into a MongoDB instance.
+
+    BSON dumps are loaded with mongorestore, JSON dumps with mongoimport.
+    Indexes are built after all collections have been loaded. Requires
+    mongorestore 3.4 or later, which supports --nsInclude.
+
+    Parameters
+    ----------
+    dumpdir : string
+        The directory which contains the dumps.
+    dbname : string, optional, default "umls"
+        The name of the database to load the dumps into. This should be
+        the same name that was passed to createdb.
+    host : string, optional, default "localhost"
+        The name of your host, or a mongodb:// URI. URIs are passed to the
+        tools with --uri, and should not contain a database name.
+    port : int
+        The port on which your mongodb instance resides.
+    dumpformat : string, optional, default "bson"
+        The format of the dumps, either "bson" or "json".
+    compress : bool, optional, default True
+        Whether the dumps are compressed using gzip.
+    overwrite : bool, optional, default False
+        Whether to drop existing collections before loading.
+    collections : list of string, optional
+        The collections to load.
+    mongorestore : string, optional, default "mongorestore"
+        The path to the mongorestore executable.
+    mongoimport : string, optional, default "mongoimport"
+        The path to the mongoimport executable.
+
+    Returns
+    -------
+    db : MongoDB.DB
+        The database into which the dumps were loaded.
+
+    """
+    db = get_client(host=host, port=port).get_database(dbname)
+    existing = set(db.list_collection_names())
+
+    for collection in collections:
+        if collection in existing and not overwrite:
+            print("{} already exists, not overwriting.".format(collection))
+            continue
+
+        path = dump_path(dumpdir, dbname, collection, dumpformat, compress)
+        print("Loading {}.".format(path))
+        common = _server_args(host, port)
+        if overwrite:
+            common.append("--drop")
+
+        if dumpformat == "bson":
+            # The dump directory has the layout of mongodump, so the
+            # collection is selected by namespace.
+            command = [mongorestore,
+                       "--noIndexRestore",
+                       "--nsInclude", "{}.{}".format(dbname, collection),
+                       "--dir", dumpdir] + common
+            if compress:
+                command.append("--gzip")
+            subprocess.check_call(command)
+        else:
+            # mongoimport does not read gzip, so stream it through stdin.
+            opener = gzip.open if compress else open
+            command = [mongoimport,
+                       "--db", dbname,
+                       "--collection", collection] + common
+            with opener(path, "rb") as f:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE)
+                shutil.copyfileobj(f, process.stdin)
+                process.stdin.close()
+                if process.wait():
+                    raise subprocess.CalledProcessError(process.returncode,
+                                                        command)
+
+    print("Building indexes.")
+    create_indexes(db)
+
+    return db
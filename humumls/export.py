@@ -0,0 +1,349 @@
+"""Columnar export of the collections to Parquet or Arrow files."""
+import os
+import shutil
+
+
+FORMATS = ("parquet", "arrow")
+
+COLLECTIONS = ("term", "string", "concept", "relation")
+
+# The name of the primary key column of each collection.
+KEYS = {"term": "lui", "string": "sui", "concept": "cui"}
+
+# The columns by which collections are partitioned by default.
+PARTITIONS = {"string": "lang", "relation": "relation"}
+
+
+def _import_pyarrow():
+    """Import pyarrow, which is an optional dependency."""
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError("Exporting requires pyarrow, which can be "
+                          "installed with pip install pyarrow.")
+    return pyarrow
+
+
+def schemas(pa):
+    """
+    Get the schemas of the exported tables.
+
+    Low-cardinality columns are dictionary-encoded. The relations of the
+    concepts are exported as a separate edge table, with one row per
+    (source, relation, target) triple.
+
+    Parameters
+    ----------
+    pa : module
+        The pyarrow module.
+
+    Returns
+    -------
+    schemas : dict
+        A dictionary mapping table names to pyarrow schemas.
+
+    """
+    string = pa.string()
+    strings = pa.list_(string)
+    category = pa.dictionary(pa.int32(), string)
+
+    return {"term": pa.schema([("lui", string),
+                               ("cui", strings),
+                               ("sui", strings)]),
+            "string": pa.schema([("sui", string),
+                                 ("string", string),
+                                 ("lower", string),
+                                 ("tokenized", string),
+                                 ("lang", category),
+                                 ("numwords", pa.int32()),
+                                 ("numwordslower", pa.int32()),
+                                 ("lui", string),
+                                 ("cui", strings)]),
+            "concept": pa.schema([("cui", string),
+                                  ("preferred", string),
+                                  ("lui", strings),
+                                  ("sui", strings),
+                                  ("definition", strings),
+                                  ("semtype", pa.list_(category))]),
+            "relation": pa.schema([("source", string),
+                                   ("relation", category),
+                                   ("target", string)])}
+
+
+class _Dictionary(object):
+    """
+    Dictionary which only grows.
+
+    Every batch is encoded with all values seen so far, so the dictionary
+    of a batch always extends that of the previous batch. This allows the
+    batches to be written to an Arrow file as dictionary deltas.
+    """
+
+    def __init__(self):
+        """Init method."""
+        self.index = {}
+        self.values = []
+
+    def encode(self, pa, values):
+        """Encode a list of values, which can contain None."""
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            try:
+                indices.append(self.index[value])
+            except KeyError:
+                self.index[value] = len(self.values)
+                indices.append(len(self.values))
+                self.values.append(value)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()),
+                                              pa.array(self.values,
+                                                       pa.string()))
+
+
+class _TableWriter(object):
+    """
+    Writes rows to one file per partition, one batch at a time.
+
+    Parameters
+    ----------
+    pa : module
+        The pyarrow module.
+    directory : string
+        The directory of the table.
+    schema : pyarrow.Schema
+        The schema of the table.
+    fmt : string
+        Either "parquet" or "arrow".
+    partition_by : string or None
+        The column by which to partition the rows. Partitions are written
+        to directories named column=value, which is the layout expected
+        by pyarrow.dataset with hive partitioning. The column itself is
+        not written to the files.
+    compression : string or None
+        The compression codec.
+
+    """
+
+    def __init__(self, pa, directory, schema, fmt, partition_by, compression):
+        """Init method."""
+        self.pa = pa
+        self.directory = directory
+        self.fmt = fmt
+        self.partition_by = partition_by
+        self.compression = compression
+        self.encoders = {f.name: _Dictionary() for f in schema
+                         if pa.types.is_dictionary(f.type)
+                         or (pa.types.is_list(f.type) and
+                             pa.types.is_dictionary(f.type.value_type))}
+        self.schema = schema
+        if partition_by is not None:
+            schema = schema.remove(schema.get_field_index(partition_by))
+        self.file_schema = schema
+        self.writers = {}
+        self.rows = 0
+
+    def _open(self, value):
+        """Open the file of a partition."""
+        directory = self.directory
+        if self.partition_by is not None:
+            directory = os.path.join(directory,
+                                     "{}={}".format(self.partition_by, value))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, "part-0.{}".format(self.fmt))
+
+        if self.fmt == "parquet":
+            writer = self.pa.parquet.ParquetWriter(
+                path,
+                self.file_schema,
+                compression=self.compression or "none")
+            return writer, None
+
+        sink = self.pa.OSFile(path, "wb")
+        options = self.pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True,
+                                              compression=self.compression)
+        writer = self.pa.ipc.new_file(sink, self.file_schema, options=options)
+        return writer, sink
+
+    def _array(self, field, values):
+        """Convert a column to an array of the type of field."""
+        pa = self.pa
+        if field.name not in self.encoders:
+            return pa.array(values, field.type)
+        encoder = self.encoders[field.name]
+        if pa.types.is_dictionary(field.type):
+            return encoder.encode(pa, values)
+        offsets = [0]
+        flat = []
+        for x in values:
+            flat.extend(x or ())
+            offsets.append(len(flat))
+        return pa.ListArray.from_arrays(pa.array(offsets, pa.int32()),
+                                        encoder.encode(pa, flat),
+                                        mask=pa.array([x is None
+                                                       for x in values]))
+
+    def write(self, columns):
+        """
+        Write a batch of rows.
+
+        Parameters
+        ----------
+        columns : dict
+            A dictionary mapping every column of the schema to a list of
+            values.
+
+        """
+        if not columns or not next(iter(columns.values())):
+            return
+        if self.partition_by is None:
+            groups = {None: columns}
+        else:
+            groups = {}
+            for idx, value in enumerate(columns[self.partition_by]):
+                groups.setdefault(value, []).append(idx)
+            groups = {value: {k: [v[i] for i in idx]
+                              for k, v in columns.items()}
+                      for value, idx in groups.items()}
+
+        for value, group in groups.items():
+            arrays = [self._array(f, group[f.name])
+                      for f in self.file_schema]
+            batch = self.pa.record_batch(arrays, schema=self.file_schema)
+            try:
+                writer, _ = self.writers[value]
+            except KeyError:
+                self.writers[value] = self._open(value)
+                writer, _ = self.writers[value]
+            writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        """Close all files."""
+        for writer, sink in self.writers.values():
+            writer.close()
+            if sink is not None:
+                sink.close()
+
+
+def _columns(documents, schema, key):
+    """Convert documents to columns, renaming _id to key."""
+    return {f.name: [d.get("_id" if f.name == key else f.name)
+                     for d in documents]
+            for f in schema}
+
+
+def _edges(documents):
+    """Explode the relations of concepts into (source, relation, target)."""
+    edges = {"source": [], "relation": [], "target": []}
+    for d in documents:
+        for relation, targets in d.get("rel", {}).items():
+            for target in targets:
+                edges["source"].append(d["_id"])
+                edges["relation"].append(relation)
+                edges["target"].append(target)
+    return edges
+
+
+def exportdb(db,
+             outdir,
+             collections=COLLECTIONS,
+             fmt="parquet",
+             batch_size=10000,
+             partition_by=PARTITIONS,
+             compression=None,
+             overwrite=False):
+    """
+    Export the collections of a database to Parquet or Arrow files.
+
+    The collections are read using `Table.scan`, and every batch is
+    written directly, so memory usage only depends on the batch size.
+    Each table is written to its own directory in outdir, which can be
+    read with pyarrow.dataset, e.g.
+    pyarrow.dataset.dataset("out/string", partitioning="hive").
+
+    Parameters
+    ----------
+    db : Db
+        The database to export.
+    outdir : string
+        The directory to write to.
+    collections : tuple of string, optional
+        The tables to export, any of "term", "string", "concept" and
+        "relation". The relation table is an edge table created from the
+        rel field of the concepts, which is not part of the concept table.
+    fmt : string, optional, default "parquet"
+        The format of the files, either "parquet" or "arrow". Arrow files
+        use the IPC file format, which can be memory-mapped.
+    batch_size : int, optional, default 10000
+        The number of documents per batch. Each batch is written as a
+        separate row group or record batch.
+    partition_by : dict, optional, default PARTITIONS
+        A dictionary mapping table names to the column by which to
+        partition that table. By default, strings are partitioned by
+        language, and relations by relation type.
+    compression : string, optional, default None
+        The compression codec. If this is None, Parquet files are
+        compressed with snappy, and Arrow files are not compressed, so
+        they can be read without copying.
+    overwrite : bool, optional, default False
+        Whether to overwrite tables which were already exported.
+
+    Returns
+    -------
+    rows : dict
+        A dictionary mapping table names to the number of rows written.
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError("fmt should be one of {}, not {}"
+                         "".format(FORMATS, fmt))
+    unknown = set(collections) - set(COLLECTIONS)
+    if unknown:
+        raise ValueError("Unknown collections: {}".format(sorted(unknown)))
+
+    pa = _import_pyarrow()
+    if compression is None and fmt == "parquet":
+        compression = "snappy"
+    tables = schemas(pa)
+
+    writers = {}
+    for name in collections:
+        directory = os.path.join(outdir, name)
+        if os.path.exists(directory):
+            if not overwrite:
+                print("{} already exists, not overwriting.".format(directory))
+                continue
+            shutil.rmtree(directory)
+        writers[name] = _TableWriter(pa,
+                                     directory,
+                                     tables[name],
+                                     fmt,
+                                     partition_by.get(name),
+                                     compression)
+
+    scans = [(name, getattr(db, name), None)
+             for name in ("term", "string") if name in writers]
+    # Concepts and relations are written from a single scan.
+    if "concept" in writers:
+        scans.append(("concept", db.concept, None))
+    elif "relation" in writers:
+        scans.append(("concept", db.concept, {"rel": 1}))
+
+    try:
+        for name, table, filt in scans:
+            print("Exporting {}.".format(name))
+            for batch in table.scan(filt=filt or (), batch_size=batch_size):
+                if name in writers:
+                    writer = writers[name]
+                    writer.write(_columns(batch, writer.schema, KEYS[name]))
+                if name == "concept" and "relation" in writers:
+                    writers["relation"].write(_edges(batch))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return {name: writer.rows for name, writer in writers.items()}
@@ -0,0 +1,86 @@
+"""
+Check that importing humumls stays lightweight.
+
+Run as `python -m humumls.importcheck`. Exits with a non-zero status if
+`import humumls` loads any of the ingestion modules or their
+dependencies, or takes longer than the given budget.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+# Modules which should only be imported when they are first used.
+FORBIDDEN = ("langid",
+             "tqdm",
+             "numpy",
+             "pyarrow",
+             "humumls.tablecreator",
+             "humumls.dump",
+             "humumls.export",
+             "humumls.rrf",
+             "humumls.aio")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import humumls
+end = time.perf_counter()
+print(json.dumps({"seconds": end - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def check_import(forbidden=FORBIDDEN, budget=None, python=sys.executable):
+    """
+    Import humumls in a fresh interpreter, and check what was imported.
+
+    Parameters
+    ----------
+    forbidden : list of string, optional
+        Modules which should not be imported. Submodules of these modules
+        are also not allowed.
+    budget : float, optional, default None
+        The maximum import time in seconds. If this is None, the import
+        time is not checked.
+    python : string, optional
+        The python executable to use.
+
+    Returns
+    -------
+    errors : list of string
+        A description of every problem found. Empty if there are none.
+
+    """
+    output = subprocess.check_output([python, "-c", SCRIPT])
+    result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    errors = []
+    for name in forbidden:
+        if any(m == name or m.startswith(name + ".")
+               for m in result["modules"]):
+            errors.append("{} was imported.".format(name))
+    if budget is not None and result["seconds"] > budget:
+        errors.append("Importing took {:.3f}s, the budget is {:.3f}s."
+                      "".format(result["seconds"], budget))
+
+    return errors
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--budget",
+                        type=float,
+                        default=None,
+                        help="Maximum import time in seconds.")
+    args = parser.parse_args(argv)
+
+    errors = check_import(budget=args.budget)
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""Pipelined build, which overlaps parsing and writing to the database."""
+import queue
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+
+from pymongo.errors import BulkWriteError
+from tqdm import tqdm
+
+from .buildmetrics import BuildMetrics, PhaseStats
+from .rrf import count_lines, read_rrf
+from .tablecreator import (_add_concept,
+                           _add_string,
+                           _add_term,
+                           _count_lines,
+                           _finalize_concepts,
+                           _finalize_strings,
+                           _prepare_collection,
+                           process_mrdef,
+                           process_mrrel,
+                           process_mrsty)
+
+
+class Writers(object):
+    """
+    Pool of threads which insert batches of documents.
+
+    Documents are submitted per collection, and split into batches by a
+    separate feeder thread, so submitting does not block. The queue
+    between the feeders and the writers is bounded, so at most queue_size
+    batches are held in memory at any time.
+
+    Parameters
+    ----------
+    collections : dict
+        A dictionary mapping names to MongoDB collections.
+    num_writers : int, optional, default 4
+        The number of writer threads.
+    batch_size : int, optional, default 1000
+        The number of documents per insert_many call.
+    queue_size : int, optional, default 16
+        The maximum number of batches waiting to be written.
+    metrics : BuildMetrics, optional, default None
+        If this is not None, an insert phase is added per collection once
+        all its documents are written.
+
+    """
+
+    def __init__(self,
+                 collections,
+                 num_writers=4,
+                 batch_size=1000,
+                 queue_size=16,
+                 metrics=None):
+        """Init method."""
+        if num_writers < 1:
+            raise ValueError("num_writers should be a positive integer.")
+        self.collections = collections
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.queue = queue.Queue(queue_size)
+        self.errors = []
+        self.stopped = threading.Event()
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._start = {}
+        self._cpu = defaultdict(float)
+        self._pending = defaultdict(int)
+        self._fed = set()
+        self._feeders = []
+        self._threads = [threading.Thread(target=self._write)
+                         for _ in range(num_writers)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _write(self):
+        """Insert batches until a None is received. Runs in a thread."""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            name, batch = item
+            cpu = time.thread_time()
+            written = 0
+            try:
+                if not self.errors and not self.stopped.is_set():
+                    self.collections[name].insert_many(batch, ordered=False)
+                    written = len(batch)
+            except BulkWriteError as e:
+                written = e.details.get("nInserted", 0)
+                with self._lock:
+                    self.errors.append(e)
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(e)
+            cpu = time.thread_time() - cpu
+            with self._lock:
+                self._stats[name].documents += written
+                self._cpu[name] += cpu
+                self._pending[name] -= 1
+                done = name in self._fed and not self._pending[name]
+            if done:
+                self._finish(name)
+
+    def _feed(self, name, documents):
+        """Split documents into batches. Runs in a thread."""
+        documents = iter(documents)
+        while not self.errors and not self.stopped.is_set():
+            batch = list(islice(documents, self.batch_size))
+            if not batch:
+                break
+            with self._lock:
+                self._pending[name] += 1
+            self.queue.put((name, batch))
+        with self._lock:
+            self._fed.add(name)
+            done = not self._pending[name]
+        if done:
+            self._finish(name)
+
+    def _finish(self, name):
+        """Add the insert phase of a collection to the metrics."""
+        if self.metrics is not None:
+            self.metrics.add(self._stats[name],
+                             time.perf_counter() - self._start[name],
+                             self._cpu[name])
+
+    def submit(self, name, documents):
+        """
+        Start writing documents to a collection in the background.
+
+        Parameters
+        ----------
+        name : string
+            The name of the collection.
+        documents : iterable of dict
+            The documents to write.
+
+        """
+        self._raise()
+        self._stats[name] = PhaseStats("insert_{}".format(name))
+        self._start[name] = time.perf_counter()
+        feeder = threading.Thread(target=self._feed, args=(name, documents))
+        feeder.daemon = True
+        feeder.start()
+        self._feeders.append(feeder)
+
+    def _raise(self):
+        """Raise the first error of a writer, if any."""
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self, cancel=False):
+        """
+        Stop the threads.
+
+        Parameters
+        ----------
+        cancel : bool, optional, default False
+            If this is False, wait until all documents are written, and
+            raise the first error of a writer, if any. Otherwise, stop as
+            soon as possible, and discard the documents which were not
+            written yet.
+
+        """
+        if cancel:
+            self.stopped.set()
+        for feeder in self._feeders:
+            feeder.join()
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if not cancel:
+            self._raise()
+
+
+def _read_batches(path, name, prefetch, stats, batches, size, stop):
+    """Put batches of lines on a queue. Runs in the reader thread."""
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    lines = read_rrf(path, name, prefetch, stats)
+    try:
+        while True:
+            batch = list(islice(lines, size))
+            if not batch:
+                break
+            if not put(batch):
+                return
+        put(None)
+    except Exception as e:
+        put(e)
+    finally:
+        lines.close()
+
+
+def _assemble_mrconso(path,
+                      languages,
+                      build_terms,
+                      build_strings,
+                      build_concepts,
+                      prefetch,
+                      stats,
+                      batch_size=10000,
+                      queue_size=8):
+    """
+    Build terms, strings and concepts in a single pass over MRCONSO.
+
+    A reader thread reads and decompresses batches of lines, while the
+    calling thread parses them.
+    """
+    terms = defaultdict(dict)
+    strings = defaultdict(dict)
+    concepts = defaultdict(dict)
+
+    batches = queue.Queue(queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_batches,
+                              args=(path,
+                                    "MRCONSO",
+                                    prefetch,
+                                    stats,
+                                    batches,
+                                    batch_size,
+                                    stop))
+    reader.daemon = True
+    reader.start()
+
+    num_lines = count_lines(path, "MRCONSO")
+    print("Reading MRCONSO for terms, strings and concepts.")
+    try:
+        _parse_batches(batches,
+                       languages,
+                       terms if build_terms else None,
+                       strings if build_strings else None,
+                       concepts if build_concepts else None,
+                       num_lines)
+    finally:
+        stop.set()
+        reader.join()
+
+    return terms, strings, concepts
+
+
+def _parse_batches(batches, languages, terms, strings, concepts, num_lines):
+    """Parse batches of MRCONSO lines until the reader is done."""
+    with tqdm(total=num_lines) as progress:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            for record in batch:
+                split = record.strip().split("|")
+
+                if languages and split[1] not in languages:
+                    continue
+
+                if terms is not None:
+                    _add_term(terms, split)
+                if strings is not None:
+                    _add_string(strings, split)
+                if concepts is not None:
+                    _add_concept(concepts, split)
+            progress.update(len(batch))
+
+
+def build_pipelined(db,
+                    path,
+                    languages,
+                    process_definitions=True,
+                    process_relations=True,
+                    process_semantic_types=True,
+                    preprocessor=lambda x: x,
+                    overwrite=False,
+                    prefetch="thread",
+                    num_writers=4,
+                    batch_size=1000,
+                    queue_size=16,
+                    metrics=None):
+    """
+    Build the term, string and concept collections in a pipeline.
+
+    MRCONSO is read only once, by a reader thread, while the calling
+    thread assembles the terms, strings and concepts, so reading and
+    decompressing overlaps with parsing. A term or string document can
+    only be written once all of MRCONSO is read, as its lines are spread
+    over the whole file. After MRCONSO, the writer threads write the
+    terms and strings while the calling thread completes the concepts
+    using MRDEF, MRREL and MRSTY. The concepts are written last, and
+    nothing overlaps with that, which is measured by the insert_wait
+    phase.
+
+    If anything fails, the reader and writer threads are stopped, and
+    the documents which were not written yet are discarded.
+
+    Parameters
+    ----------
+    db : MongoDB.DB
+        The database in which to create the collections.
+    path : string
+        The path to the META directory, or a zip archive.
+    languages : set of string
+        The languages to extract, in UMLS format.
+    process_definitions : bool, optional, default True
+        Whether to process MRDEF.
+    process_relations : bool, optional, default True
+        Whether to process MRREL.
+    process_semantic_types : bool, optional, default True
+        Whether to process MRSTY.
+    preprocessor : function, optional, default identity
+        The preprocessor for definitions.
+    overwrite : bool, optional, default False
+        Whether to overwrite existing collections.
+    prefetch : string, optional, default "thread"
+        Whether to decompress the RRF files in the background, see
+        `humumls.rrf.read_rrf`.
+    num_writers : int, optional, default 4
+        The number of writer threads.
+    batch_size : int, optional, default 1000
+        The number of documents per insert_many call.
+    queue_size : int, optional, default 16
+        The maximum number of batches waiting to be written.
+    metrics : BuildMetrics, optional, default None
+        Collects the metrics of every phase. The insert phases overlap
+        with the parsing phases. The CPU time of the writer threads is
+        only counted in the insert phases, and the CPU time of the other
+        phases is that of the calling thread only, so it does not include
+        the reader thread or a prefetch thread.
+
+    """
+    if metrics is None:
+        metrics = BuildMetrics()
+
+    collections = {}
+    for name in ("term", "string", "concept"):
+        collection = _prepare_collection(db, name, overwrite)
+        if collection is not None:
+            collections[name] = collection
+    if not collections:
+        return
+
+    _count_lines(path,
+                 collections,
+                 process_definitions,
+                 process_relations,
+                 process_semantic_types,
+                 metrics)
+
+    writers = Writers(collections,
+                      num_writers,
+                      batch_size,
+                      queue_size,
+                      metrics)
+    try:
+        _build(writers,
+               path,
+               languages,
+               collections,
+               process_definitions,
+               process_relations,
+               process_semantic_types,
+               preprocessor,
+               prefetch,
+               metrics)
+    except BaseException:
+        writers.close(cancel=True)
+        raise
+
+    with metrics.phase("insert_wait", thread_cpu=True):
+        writers.close()
+
+
+def _build(writers,
+           path,
+           languages,
+           collections,
+           process_definitions,
+           process_relations,
+           process_semantic_types,
+           preprocessor,
+           prefetch,
+           metrics):
+    """Parse the RRF files, and submit the documents to the writers."""
+    with metrics.phase("mrconso", thread_cpu=True) as stats:
+        terms, strings, concepts = _assemble_mrconso(path,
+                                                     languages,
+                                                     "term" in collections,
+                                                     "string" in collections,
+                                                     "concept" in collections,
+                                                     prefetch,
+                                                     stats)
+
+    if "term" in collections:
+        writers.submit("term", list(terms.values()))
+    if "string" in collections:
+        writers.submit("string", _finalize_strings(strings))
+    del terms
+    del strings
+
+    if "concept" not in collections:
+        return
+    if process_definitions:
+        with metrics.phase("mrdef", thread_cpu=True) as stats:
+            concepts = process_mrdef(path,
+                                     concepts,
+                                     languages,
+                                     preprocessor,
+                                     prefetch,
+                                     stats)
+    if process_relations:
+        with metrics.phase("mrrel", thread_cpu=True) as stats:
+            concepts = process_mrrel(path, concepts, prefetch, stats)
+    if process_semantic_types:
+        with metrics.phase("mrsty", thread_cpu=True) as stats:
+            concepts = process_mrsty(path, concepts, prefetch, stats)
+    with metrics.phase("finalize", thread_cpu=True) as stats:
+        stats.documents = len(concepts)
+        documents = _finalize_concepts(concepts)
+    del concepts
+    writers.submit("concept", documents)
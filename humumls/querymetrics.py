@@ -0,0 +1,468 @@
+"""Opt-in latency metrics and slow-query logging for the query classes."""
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from io import open
+
+from bson import BSON
+
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5,
+           5., 10., float("inf"))
+
+logger = logging.getLogger("humumls.slow")
+
+
+def query_shape(query):
+    """
+    Replace all values in a query by placeholders.
+
+    Queries which only differ in their values have the same shape, e.g.
+    {"_id": {"$in": ["C1", "C2"]}} becomes {"_id": {"$in": ["?"]}}.
+
+    Parameters
+    ----------
+    query : object
+        A mongoDB query or filter.
+
+    Returns
+    -------
+    shape : object
+        The shape of the query.
+
+    """
+    if isinstance(query, dict):
+        return {k: query_shape(v) for k, v in query.items()}
+    if isinstance(query, (list, tuple)):
+        shapes = []
+        for x in query:
+            shape = query_shape(x)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed buckets.
+
+    Attributes
+    ----------
+    counts : list of int
+        The number of observations per bucket of BUCKETS.
+    count : int
+        The total number of observations.
+    total : float
+        The sum of all observations.
+    max : float
+        The largest observation.
+    documents : int
+        The total number of documents returned.
+    bytes : int
+        The total number of bytes decoded, if measured.
+
+    """
+
+    def __init__(self):
+        """Init method."""
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.documents = 0
+        self.bytes = 0
+
+    def observe(self, seconds, documents=0, nbytes=0):
+        """Add an observation."""
+        for idx, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[idx] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.documents += documents
+        self.bytes += nbytes
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Get the histogram as a dictionary."""
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "p50": self.quantile(.5),
+                "p95": self.quantile(.95),
+                "p99": self.quantile(.99),
+                "max": self.max,
+                "documents": self.documents,
+                "bytes": self.bytes,
+                "buckets": dict(zip(map(str, BUCKETS), self.counts))}
+
+
+class QueryMetrics(object):
+    """
+    In-process registry of query latencies.
+
+    Pass an instance to `Db` or `Connection` to record the latency of
+    every `Table` query and `Db` aggregate, per collection and method.
+    For cursors, the latency is the time spent fetching documents, which
+    is recorded once the cursor is exhausted or garbage collected.
+
+    Parameters
+    ----------
+    slow_threshold : float or dict, optional, default None
+        Queries which take at least this many seconds are logged to the
+        humumls.slow logger, and kept in slow_queries. Can also be a
+        dictionary mapping method names to thresholds. If this is None,
+        no queries are considered slow.
+    explain : bool, optional, default False
+        Whether to add the explain() plan of slow find queries to the
+        slow query log. This runs the query again.
+    measure_bytes : bool, optional, default False
+        Whether to measure the BSON size of all documents returned. This
+        encodes every document again, so it is not free.
+    max_slow_queries : int, optional, default 100
+        The number of most recent slow queries to keep.
+
+    Attributes
+    ----------
+    histograms : dict
+        A dictionary mapping (collection, method) tuples to Histograms.
+    slow_queries : deque of dict
+        The most recent slow queries.
+
+    """
+
+    def __init__(self,
+                 slow_threshold=None,
+                 explain=False,
+                 measure_bytes=False,
+                 max_slow_queries=100):
+        """Init method."""
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.measure_bytes = measure_bytes
+        self.histograms = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self._lock = threading.Lock()
+
+    def _threshold(self, method):
+        """Get the slow query threshold of a method."""
+        if isinstance(self.slow_threshold, dict):
+            return self.slow_threshold.get(method)
+        return self.slow_threshold
+
+    def size(self, documents):
+        """Get the number of bytes of documents, if measured."""
+        if not self.measure_bytes:
+            return 0
+        return sum(len(BSON.encode(d)) for d in documents if d is not None)
+
+    def record(self,
+               collection,
+               method,
+               seconds,
+               documents=0,
+               nbytes=0,
+               query=None,
+               filt=None,
+               explain=None):
+        """
+        Record a single call.
+
+        Parameters
+        ----------
+        collection : string
+            The name of the collection, or "db" for aggregates.
+        method : string
+            The name of the method.
+        seconds : float
+            The latency of the call.
+        documents : int, optional, default 0
+            The number of documents returned.
+        nbytes : int, optional, default 0
+            The number of bytes decoded.
+        query : dict, optional, default None
+            The query, whose shape is added to the slow query log.
+        filt : dict, optional, default None
+            The filter, whose shape is added to the slow query log.
+        explain : function, optional, default None
+            A function without arguments which returns the query plan.
+            Only called for slow queries if explain is enabled.
+
+        """
+        with self._lock:
+            key = (collection, method)
+            try:
+                histogram = self.histograms[key]
+            except KeyError:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds, documents, nbytes)
+
+        threshold = self._threshold(method)
+        if threshold is None or seconds < threshold:
+            return
+
+        entry = {"time": time.time(),
+                 "collection": collection,
+                 "method": method,
+                 "seconds": seconds,
+                 "documents": documents,
+                 "query": query_shape(query) if query else None,
+                 "filter": query_shape(filt) if filt else None}
+        if self.explain and explain is not None:
+            try:
+                entry["explain"] = explain()
+            except Exception as e:
+                entry["explain"] = "explain failed: {}".format(e)
+        logger.warning("Slow query: %s.%s took %.3fs, %d documents, "
+                       "query %s",
+                       collection,
+                       method,
+                       seconds,
+                       documents,
+                       entry["query"])
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    def snapshot(self):
+        """
+        Get all metrics as a dictionary.
+
+        Returns
+        -------
+        metrics : dict
+            A dictionary with the histograms per collection and method,
+            and the slow queries.
+
+        """
+        with self._lock:
+            collections = {}
+            for (collection, method), h in self.histograms.items():
+                collections.setdefault(collection, {})[method] = h.to_dict()
+            return {"collections": collections,
+                    "slow_queries": list(self.slow_queries)}
+
+    def dump(self, path):
+        """Write a snapshot to a JSON file."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.snapshot(), default=str, indent=2))
+
+    def to_prometheus(self, prefix="humumls_query"):
+        """
+        Get the histograms in the Prometheus text exposition format.
+
+        Parameters
+        ----------
+        prefix : string, optional, default "humumls_query"
+            The prefix of the metric names.
+
+        Returns
+        -------
+        text : string
+            The metrics, which can be served on a metrics endpoint.
+
+        """
+        lines = ["# TYPE {}_seconds histogram".format(prefix)]
+        with self._lock:
+            items = sorted(self.histograms.items())
+            for (collection, method), h in items:
+                labels = 'collection="{}",method="{}"'.format(collection,
+                                                              method)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('{}_seconds_bucket{{{},le="{}"}} {}'
+                                 ''.format(prefix, labels, le, cumulative))
+                lines.append("{}_seconds_sum{{{}}} {}".format(prefix,
+                                                              labels,
+                                                              h.total))
+                lines.append("{}_seconds_count{{{}}} {}".format(prefix,
+                                                                labels,
+                                                                h.count))
+            lines.append("# TYPE {}_documents_total counter".format(prefix))
+            for (collection, method), h in items:
+                lines.append('{}_documents_total{{collection="{}",'
+                             'method="{}"}} {}'.format(prefix,
+                                                       collection,
+                                                       method,
+                                                       h.documents))
+            lines.append("# TYPE {}_bytes_total counter".format(prefix))
+            for (collection, method), h in items:
+                lines.append('{}_bytes_total{{collection="{}",'
+                             'method="{}"}} {}'.format(prefix,
+                                                       collection,
+                                                       method,
+                                                       h.bytes))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Remove all recorded metrics."""
+        with self._lock:
+            self.histograms = {}
+            self.slow_queries.clear()
+
+
+class TimedCursor(object):
+    """
+    Wraps a cursor, and records the time spent fetching its documents.
+
+    All other attributes are passed to the wrapped cursor.
+
+    Parameters
+    ----------
+    cursor : MongoDB Cursor
+        The cursor to wrap.
+    metrics : QueryMetrics
+        The registry to record to.
+    collection : string
+        The name of the collection.
+    method : string
+        The name of the method which created the cursor.
+    query : dict
+        The query of the cursor.
+    filt : dict
+        The filter of the cursor.
+
+    """
+
+    def __init__(self, cursor, metrics, collection, method, query, filt):
+        """Init method."""
+        self.cursor = cursor
+        self.metrics = metrics
+        self.collection = collection
+        self.method = method
+        self.query = query
+        self.filt = filt
+        self._seconds = 0.
+        self._documents = 0
+        self._bytes = 0
+        self._recorded = False
+
+    def __iter__(self):
+        """Return self, as the cursor is its own iterator."""
+        return self
+
+    def __next__(self):
+        """Get the next document."""
+        start = time.perf_counter()
+        try:
+            doc = next(self.cursor)
+        except StopIteration:
+            self._seconds += time.perf_counter() - start
+            self._record()
+            raise
+        self._seconds += time.perf_counter() - start
+        self._documents += 1
+        if self.metrics.measure_bytes:
+            self._bytes += self.metrics.size([doc])
+        return doc
+
+    next = __next__
+
+    def __getattr__(self, name):
+        """Pass all other attributes to the wrapped cursor."""
+        if name == "cursor":
+            raise AttributeError(name)
+        value = getattr(self.cursor, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def method(*args, **kwargs):
+            result = value(*args, **kwargs)
+            # Keep chained calls such as limit() and sort() wrapped.
+            if result is self.cursor:
+                return self
+            if isinstance(result, type(self.cursor)):
+                return TimedCursor(result,
+                                   self.metrics,
+                                   self.collection,
+                                   self.method,
+                                   self.query,
+                                   self.filt)
+            return result
+
+        return method
+
+    def _explain(self):
+        """Get the query plan of the query."""
+        collection = self.cursor.collection
+        if self.filt:
+            return collection.find(self.query, self.filt).explain()
+        return collection.find(self.query).explain()
+
+    def _record(self, explain=True):
+        """Record the cursor, if this has not happened yet."""
+        if self._recorded:
+            return
+        self._recorded = True
+        self.metrics.record(self.collection,
+                            self.method,
+                            self._seconds,
+                            self._documents,
+                            self._bytes,
+                            self.query,
+                            self.filt,
+                            self._explain if explain else None)
+
+    def __del__(self):
+        """
+        Record cursors which were not exhausted.
+
+        The query is never explained here, as that would query the server
+        during garbage collection.
+        """
+        if getattr(self, "_seconds", 0):
+            self._record(explain=False)
+
+
+# The number of timed Db methods which are running, per thread.
+_depth = threading.local()
+
+
+def timed(func):
+    """
+    Record the latency of a Db method, if the Db has metrics.
+
+    The number of documents is the length of the result, if it has one.
+    Methods which call themselves, or other timed methods, are only
+    recorded once, for the outermost call.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        metrics = self._connection.metrics
+        if metrics is None or getattr(_depth, "value", 0):
+            return func(self, *args, **kwargs)
+        _depth.value = 1
+        start = time.perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+        finally:
+            _depth.value = 0
+        seconds = time.perf_counter() - start
+        try:
+            documents = len(result)
+        except TypeError:
+            documents = 0
+        metrics.record("db", func.__name__, seconds, documents)
+        return result
+
+    return wrapper
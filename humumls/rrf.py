@@ -0,0 +1,331 @@
+"""Readers for RRF files, either extracted, compressed or inside archives."""
+import functools
+import glob
+import gzip
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import zipfile
+from contextlib import ExitStack
+from io import open
+
+
+CHUNKSIZE = 1 << 20
+
+# Matches NAME.RRF, NAME.RRF.gz, NAME.RRF.aa, NAME.RRF.aa.gz, etc.
+PARTPATTERN = r"^{}\.RRF(\.[a-z]{{2}})?(\.gz)?$"
+
+# The extensions of zip archives inside zip archives. The UMLS full
+# release contains the RRF files in *-meta.nlm archives.
+NESTED = (".zip", ".nlm")
+
+
+def _match(filenames, name):
+    """Get the filenames which are (parts of) NAME.RRF, in order."""
+    pattern = re.compile(PARTPATTERN.format(re.escape(name)))
+    matches = sorted(f for f in filenames
+                     if pattern.match(os.path.basename(f)))
+    # If both extracted and compressed versions of a file or part exist,
+    # prefer the extracted one, so that no line is read twice.
+    parts = {}
+    for f in matches:
+        key = os.path.basename(f)
+        if key.endswith(".gz"):
+            key = key[:-3]
+        if key not in parts or parts[key].endswith(".gz"):
+            parts[key] = f
+    # Prefer the whole file over its parts.
+    whole = "{}.RRF".format(name)
+    if whole in parts:
+        return [parts[whole]]
+    # Parts can be in different nested archives, so sort by name first.
+    return sorted(parts.values(), key=lambda f: (os.path.basename(f), f))
+
+
+def _zip_members(archive, chain):
+    """List (chain, member) tuples of an archive and its nested archives."""
+    members = []
+    for member in archive.namelist():
+        if member.lower().endswith(NESTED):
+            with archive.open(member) as f:
+                if zipfile.is_zipfile(f):
+                    with zipfile.ZipFile(f) as nested:
+                        members.extend(_zip_members(nested,
+                                                    chain + (member,)))
+                    continue
+        members.append((chain, member))
+    return members
+
+
+@functools.lru_cache(maxsize=8)
+def _list_zip(path, size, mtime):
+    """
+    List all members of a zip archive, including nested archives.
+
+    Listing a compressed nested archive decompresses it once, so the
+    listing is cached for as long as the archive does not change.
+    """
+    with zipfile.ZipFile(path) as archive:
+        return _zip_members(archive, (path,))
+
+
+def find_parts(path, name):
+    """
+    Find the file, or files, which make up an RRF file.
+
+    Parameters
+    ----------
+    path : string
+        The path to the META directory, to a directory which contains
+        the META directory, or to a zip archive of the UMLS distribution.
+        Zip archives are searched recursively, so this can also be the
+        full release archive, in which the RRF files are inside nested
+        *-meta.nlm zip archives.
+    name : string
+        The name of the RRF file, without extension, e.g. "MRCONSO".
+
+    Returns
+    -------
+    parts : list of tuples
+        A list of (archive, filename) tuples, which should be read in
+        order. For files which are not in a zip archive, archive is None.
+        Otherwise, archive is a tuple of the path of the zip archive,
+        followed by the names of the nested archives which contain the
+        file, if any.
+
+    """
+    if zipfile.is_zipfile(path):
+        stat = os.stat(path)
+        members = _list_zip(path, stat.st_size, stat.st_mtime)
+        # Identify members by their full path through nested archives.
+        paths = {"/".join(chain[1:] + (m,)): (chain, m)
+                 for chain, m in members}
+        parts = [paths[p] for p in _match(paths, name)]
+    else:
+        parts = []
+        for directory in (path, os.path.join(path, "META")):
+            files = glob.glob(os.path.join(directory, "{}.RRF*".format(name)))
+            parts = [(None, f) for f in _match(files, name)]
+            if parts:
+                break
+
+    if not parts:
+        raise IOError("Could not find {}.RRF in {}".format(name, path))
+    return parts
+
+
+def _open_archive(stack, chain, archives):
+    """Open a zip archive, which can be nested in other archives."""
+    try:
+        return archives[chain]
+    except KeyError:
+        pass
+    if len(chain) == 1:
+        archive = stack.enter_context(zipfile.ZipFile(chain[0]))
+    else:
+        parent = _open_archive(stack, chain[:-1], archives)
+        f = stack.enter_context(parent.open(chain[-1]))
+        archive = stack.enter_context(zipfile.ZipFile(f))
+    archives[chain] = archive
+    return archive
+
+
+def _read_parts(parts):
+    """Read the decompressed contents of parts, in chunks of bytes."""
+    with ExitStack() as archives_stack:
+        # Archives stay open, as consecutive parts are usually in the same
+        # nested archive.
+        archives = {}
+        for archive, filename in parts:
+            with ExitStack() as stack:
+                if archive is None:
+                    f = stack.enter_context(open(filename, "rb"))
+                else:
+                    archive = _open_archive(archives_stack,
+                                            archive,
+                                            archives)
+                    f = stack.enter_context(archive.open(filename))
+                if filename.endswith(".gz"):
+                    f = stack.enter_context(gzip.GzipFile(fileobj=f))
+                while True:
+                    chunk = f.read(CHUNKSIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+
+def _prefetch_thread(parts, maxsize=8):
+    """Read chunks in a separate thread."""
+    chunks = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for chunk in _read_parts(parts):
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=read)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _send_parts(parts, connection):
+    """Send the chunks of parts over a pipe. Runs in a separate process."""
+    for chunk in _read_parts(parts):
+        connection.send_bytes(chunk)
+    connection.send_bytes(b"")
+    connection.close()
+
+
+def _prefetch_process(parts):
+    """Read chunks in a separate process."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_send_parts,
+                                      args=(parts, sender))
+    process.daemon = True
+    process.start()
+    sender.close()
+
+    try:
+        while True:
+            try:
+                chunk = receiver.recv_bytes()
+            except EOFError:
+                chunk = None
+            if not chunk:
+                break
+            yield chunk
+        process.join()
+        if process.exitcode:
+            raise IOError("Reading {} failed with exit code {}"
+                          "".format(parts, process.exitcode))
+    finally:
+        if process.is_alive():
+            process.terminate()
+        receiver.close()
+
+
+def read_rrf(path, name, prefetch=None, stats=None):
+    """
+    Iterate over the lines of an RRF file.
+
+    The RRF file can be extracted, gzip-compressed, split into parts, e.g.
+    MRCONSO.RRF.aa and MRCONSO.RRF.ab, and inside a zip archive. Files are
+    decompressed while they are read, so nothing is written to disk.
+
+    Parameters
+    ----------
+    path : string
+        The path to the META directory, to a directory which contains
+        the META directory, or to a zip archive of the UMLS distribution.
+    name : string
+        The name of the RRF file, without extension, e.g. "MRCONSO".
+    prefetch : string, optional, default None
+        Whether to read and decompress in the background, which lets
+        decompression overlap with parsing. Either None, "thread" or
+        "process".
+    stats : PhaseStats, optional, default None
+        If this is not None, the number of lines and decompressed bytes
+        read are added to its records and bytes_read counters.
+
+    Returns
+    -------
+    lines : generator
+        A generator over the lines, without newlines.
+
+    """
+    parts = find_parts(path, name)
+    if prefetch is None:
+        chunks = _read_parts(parts)
+    elif prefetch == "thread":
+        chunks = _prefetch_thread(parts)
+    elif prefetch == "process":
+        chunks = _prefetch_process(parts)
+    else:
+        raise ValueError("prefetch should be None, 'thread' or 'process', "
+                         "not {}".format(prefetch))
+
+    rest = b""
+    for chunk in chunks:
+        if stats is not None:
+            stats.bytes_read += len(chunk)
+        chunk = rest + chunk
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            rest = chunk
+            continue
+        rest = chunk[end + 1:]
+        lines = chunk[:end].decode("utf-8").split("\n")
+        if stats is not None:
+            stats.records += len(lines)
+        for line in lines:
+            yield line
+    if rest:
+        if stats is not None:
+            stats.records += 1
+        yield rest.decode("utf-8")
+
+
+def count_lines(path, name):
+    """
+    Count the lines of an RRF file, e.g. to show progress.
+
+    Lines are only counted for extracted files, as counting the lines of
+    compressed files is as slow as reading them. Counts are cached for as
+    long as the size and modification time of the files do not change.
+
+    Parameters
+    ----------
+    path : string
+        The path to the META directory, a directory which contains the META
+        directory, or a zip archive of the UMLS distribution.
+    name : string
+        The name of the RRF file, without extension, e.g. "MRCONSO".
+
+    Returns
+    -------
+    num : int or None
+        The number of lines, or None if the file is compressed.
+
+    """
+    parts = find_parts(path, name)
+    if any(a is not None or f.endswith(".gz") for a, f in parts):
+        return None
+    stamps = []
+    for _, filename in parts:
+        stat = os.stat(filename)
+        stamps.append((stat.st_size, stat.st_mtime))
+    return _count_parts(tuple(parts), tuple(stamps))
+
+
+@functools.lru_cache(maxsize=32)
+def _count_parts(parts, stamps):
+    """Count the lines of parts, which are cached while stamps match."""
+    return sum(chunk.count(b"\n") for chunk in _read_parts(parts))
@@ -1,4 +1,35 @@
 """Table classes, both specific for UMLS and base classes."""
+import time
+
+from pymongo import ASCENDING
+
+from .querymetrics import TimedCursor
+
+
+def with_id(filt):
+    """
+    Make sure a filtering dictionary retrieves the primary key.
+
+    Parameters
+    ----------
+    filt : dict
+        The filtering dictionary, which may exclude the primary key.
+
+    Returns
+    -------
+    filt : dict or None
+        A filtering dictionary which includes the primary key, or None if
+        filt was empty or only excluded the primary key.
+
+    """
+    filt = dict(filt or {})
+    rest = {k: v for k, v in filt.items() if k != "_id"}
+    if not rest:
+        # Only the primary key, or everything except it, was requested.
+        return {"_id": 1} if filt.get("_id") else None
+    if all(rest.values()):
+        rest["_id"] = 1
+    return rest
 
 
 class Table(object):
@@ -19,7 +50,11 @@ class Table(object):
         """Init method."""
         self.classname = classname
         self.connection = connection
-        self._connection = self.connection.db.get_collection(self.classname)
+
+    @property
+    def _connection(self):
+        """The collection queried by this table."""
+        return self.connection.get_collection(self.classname)
 
     def __getitem__(self, key):
         """
@@ -56,10 +91,23 @@ class Table(object):
             A cursor pointing towards the objects.
 
         """
+        return self._find(query, filt, "retrieve")
+
+    def _find(self, query, filt, method):
+        """Run a find query, and record it if there are metrics."""
         if filt:
-            return self._connection.find(query, filt)
+            cursor = self._connection.find(query, filt)
         else:
-            return self._connection.find(query)
+            cursor = self._connection.find(query)
+        metrics = self.connection.metrics
+        if metrics is None:
+            return cursor
+        return TimedCursor(cursor,
+                           metrics,
+                           self.classname,
+                           method,
+                           query,
+                           filt)
 
     def retrieve_one(self, query=(), filt=()):
         """
@@ -83,6 +131,25 @@ class Table(object):
             A cursor pointing towards the objects.
 
         """
+        metrics = self.connection.metrics
+        if metrics is None:
+            return self._find_one(query, filt)
+
+        start = time.perf_counter()
+        result = self._find_one(query, filt)
+        seconds = time.perf_counter() - start
+        metrics.record(self.classname,
+                       "retrieve_one",
+                       seconds,
+                       int(result is not None),
+                       metrics.size([result]),
+                       query,
+                       filt,
+                       lambda: self._explain(query, filt))
+        return result
+
+    def _find_one(self, query, filt):
+        """Run a find_one query."""
         if not query:
             return self._connection.find_one({}, filt)
         if filt:
@@ -90,6 +157,12 @@ class Table(object):
         else:
             return self._connection.find_one(query)
 
+    def _explain(self, query, filt):
+        """Get the query plan of a find query."""
+        if filt:
+            return self._connection.find(dict(query), filt).explain()
+        return self._connection.find(dict(query)).explain()
+
     def bunch(self, ids, filt=(), orq=True):
         """
         Return a bunch of items based on their primary keys.
@@ -115,12 +188,129 @@ class Table(object):
 
         """
         if not ids:
-            return self.retrieve({}, filt)
+            return self._find({}, filt, "bunch")
         if orq:
-            return self.retrieve({"$or": [{"_id": i}
-                                  for i in ids]}, filt)
+            return self._find({"$or": [{"_id": i}
+                               for i in ids]}, filt, "bunch")
         else:
-            return self.retrieve({"_id": {"$in": ids}}, filt)
+            return self._find({"_id": {"$in": ids}}, filt, "bunch")
+
+    def scan(self,
+             query=(),
+             filt=(),
+             batch_size=1000,
+             lower=None,
+             upper=None):
+        """
+        Scan the collection in batches, in ascending order of primary key.
+
+        The scan uses keyset pagination: every batch is a separate query
+        which starts after the last primary key of the previous batch.
+        This keeps memory usage constant, and no cursor is held open
+        between batches. Together with `partitions`, this allows multiple
+        processes to each scan a disjoint part of the collection.
+
+        Parameters
+        ----------
+        query : dict, optional, default ()
+            An additional mongoDB query to run. Conditions on the primary
+            key are combined with the bounds of the scan.
+        filt : dict, optional, default ()
+            The filtering dictionary. The primary key is always retrieved,
+            as it is needed to paginate.
+        batch_size : int, optional, default 1000
+            The maximum number of items in a single batch.
+        lower : object, optional, default None
+            The inclusive lower bound on the primary key. If this is None,
+            the scan starts at the beginning of the collection.
+        upper : object, optional, default None
+            The exclusive upper bound on the primary key. If this is None,
+            the scan continues until the end of the collection.
+
+        Returns
+        -------
+        batches : generator
+            A generator over lists of items.
+
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive integer.")
+
+        query = dict(query)
+        filt = with_id(filt)
+
+        bounds = {}
+        if lower is not None:
+            bounds["$gte"] = lower
+        if upper is not None:
+            bounds["$lt"] = upper
+
+        metrics = self.connection.metrics
+
+        while True:
+            q = dict(query)
+            if bounds:
+                if "_id" in query:
+                    # Keep any condition on _id of the caller.
+                    q = {"$and": [query, {"_id": dict(bounds)}]}
+                else:
+                    q["_id"] = dict(bounds)
+            start = time.perf_counter()
+            cursor = self._connection.find(q, filt).sort("_id", ASCENDING)
+            batch = list(cursor.limit(batch_size))
+            if metrics is not None:
+                metrics.record(self.classname,
+                               "scan",
+                               time.perf_counter() - start,
+                               len(batch),
+                               metrics.size(batch),
+                               q,
+                               filt,
+                               lambda: self._explain(q, filt))
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            bounds.pop("$gte", None)
+            bounds["$gt"] = batch[-1]["_id"]
+
+    def partitions(self, num):
+        """
+        Split the primary key space into ranges of roughly equal size.
+
+        The ranges can be passed to `scan` as lower and upper bounds, e.g.
+        to give each worker in a process pool its own part of the
+        collection.
+
+        Parameters
+        ----------
+        num : int
+            The number of partitions.
+
+        Returns
+        -------
+        ranges : list of tuples
+            A list of (lower, upper) tuples. The lower bound of the first
+            range and the upper bound of the last range are None. Might
+            contain fewer than num ranges for small collections.
+
+        """
+        if num < 1:
+            raise ValueError("num should be a positive integer.")
+        if num == 1:
+            return [(None, None)]
+
+        # $bucketAuto sorts all keys, which exceeds the memory limit of
+        # an aggregation stage for large collections before MongoDB 6.0.
+        buckets = self._connection.aggregate([{"$bucketAuto":
+                                               {"groupBy": "$_id",
+                                                "buckets": num}}],
+                                             allowDiskUse=True)
+        bounds = [b["_id"]["min"] for b in buckets][1:]
+        lowers = [None] + bounds
+        uppers = bounds + [None]
+        return list(zip(lowers, uppers))
 
 
 class String(Table):
@@ -194,10 +384,31 @@ class Concept(Table):
             list of definitions for said concept.
 
         """
-        return {x["_id"]: x["description"]
+        return {x["_id"]: x["definition"]
                 for x in self.retrieve({"definition": {"$exists": True}},
                                        {"definition": 1})}
 
+    def iter_definitions(self, batch_size=1000, lower=None, upper=None):
+        """
+        Iterate over all concepts with definitions.
+
+        Unlike `all_definitions`, this does not keep all definitions in
+        memory. See `Table.scan` for a description of the parameters.
+
+        Returns
+        -------
+        definitions : generator
+            A generator over (concept ID, list of definitions) tuples.
+
+        """
+        for batch in self.scan({"definition": {"$exists": True}},
+                               {"definition": 1},
+                               batch_size=batch_size,
+                               lower=lower,
+                               upper=upper):
+            for x in batch:
+                yield x["_id"], x["definition"]
+
     def bunch_definitions(self, cuis):
         """
         Get definitions for a bunch of concept ids.
@@ -231,7 +442,7 @@ class Concept(Table):
             A list of descriptions.
 
         """
-        return self[cui]["description"]
+        return self[cui]["definition"]
 
     def preferred(self, cui):
         """Get the preferred term associated with a single concept id."""
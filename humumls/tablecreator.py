@@ -1,14 +1,17 @@
 """Create a mongoDB from the UMLS Rich Release Format files."""
 import os
 import langid
-from io import open
 import re
 
-from pymongo import MongoClient
 from collections import defaultdict
 from pymongo.errors import CollectionInvalid
 from tqdm import tqdm
 
+from .connection import get_client
+from .buildmetrics import BuildMetrics
+from .dump import create_indexes, dump_path, write_dump
+from .rrf import count_lines, read_rrf
+
 
 PUNCT = re.compile("\W")
 
@@ -61,7 +64,14 @@ def createdb(pathtometadir,
              process_relations=True,
              process_semantic_types=True,
              preprocessor=lambda x: x,
-             overwrite=False):
+             overwrite=False,
+             dumpdir=None,
+             dumpformat="bson",
+             compress=True,
+             prefetch=None,
+             metrics=None,
+             writers=0,
+             batch_size=1000):
     """
     Create a MongoDB instance from the RRF format in which UMLS is distributed.
 
@@ -79,7 +89,9 @@ def createdb(pathtometadir,
     pathtometadir : string
         The path to the META directory which contains the RRF files. The
         only files that Humumls needs are the MRCONSO, MRDEF and MRREL
-        files.
+        files. This can also be a zip archive of the UMLS distribution,
+        and the RRF files can be gzip-compressed or split into parts,
+        see `humumls.rrf.read_rrf`.
     dbname : string, optional, default "umls"
         The name of the mongodb database you are about to create.
     host : string, optional, default "localhost"
@@ -90,11 +102,36 @@ def createdb(pathtometadir,
         The preprocessor you would like to use. This should be a function
         which takes a string and returns a string. An example of this is
         a tokenizer or a HTML stripper.
+    overwrite : bool, optional, default False
+        Whether to overwrite existing collections or dump files.
+    dumpdir : string, optional, default None
+        If this is not None, no database is created. Instead, the
+        collections are written to dump files in this directory, which
+        can be loaded later using `loaddb`, mongorestore or mongoimport.
+    dumpformat : string, optional, default "bson"
+        The format of the dump files, either "bson" or "json".
+    compress : bool, optional, default True
+        Whether to compress the dump files using gzip.
+    prefetch : string, optional, default None
+        Whether to decompress the RRF files in a background "thread" or
+        "process", so that decompression overlaps with parsing.
+    metrics : BuildMetrics, optional, default None
+        Collects the time, throughput and memory of every phase of the
+        build, see `humumls.buildmetrics.BuildMetrics`.
+    writers : int, optional, default 0
+        If this is positive, the database is built in a pipeline, see
+        `humumls.pipeline.build_pipelined`. MRCONSO is then read only
+        once, and this many threads insert the documents while the
+        remaining files are parsed. Ignored if dumpdir is not None.
+    batch_size : int, optional, default 1000
+        The number of documents per insert when writers is positive.
 
-    """
-    client = MongoClient(host=host, port=port)
-    db = client.get_database(dbname)
+    Returns
+    -------
+    db : MongoDB.DB or None
+        The created database, or None if dump files were written.
 
+    """
     # Remove any duplicates
     languages = set(languages)
 
@@ -103,70 +140,190 @@ def createdb(pathtometadir,
         {LANGDICT[l.upper()] for l in languages}
     except KeyError:
         raise KeyError("Not all languages you passed are valid.")
-    # First create necessary paths, to fail early.
-    try:
-        collection = db.create_collection("term")
-        terms = _create_terms(pathtometadir, languages)
-        collection.insert_many(terms)
-        del(terms)
-    except CollectionInvalid:
-        if overwrite:
-            db.drop_collection("term")
-            collection = db.create_collection("term")
-            terms = _create_terms(pathtometadir, languages)
-            collection.insert_many(terms)
-            del(terms)
-        else:
-            print("term already exists, not overwriting.")
 
-    try:
-        collection = db.create_collection("string")
-        strings = _create_strings(pathtometadir, languages)
-        collection.insert_many(strings)
-        del(strings)
-    except CollectionInvalid:
-        if overwrite:
-            db.drop_collection("string")
-            collection = db.create_collection("string")
-            strings = _create_strings(pathtometadir, languages)
-            collection.insert_many(strings)
-            del(strings)
-        else:
-            print("string already exists, not overwriting.")
+    if metrics is None:
+        metrics = BuildMetrics()
+
+    def create_concepts():
+        return _create_concepts(pathtometadir,
+                                process_definitions,
+                                process_relations,
+                                process_semantic_types,
+                                languages,
+                                preprocessor,
+                                prefetch,
+                                metrics)
+
+    def create_terms():
+        with metrics.phase("mrconso_terms") as stats:
+            return _create_terms(pathtometadir, languages, prefetch, stats)
+
+    def create_strings():
+        with metrics.phase("mrconso_strings") as stats:
+            return _create_strings(pathtometadir, languages, prefetch, stats)
+
+    builders = [("term", create_terms),
+                ("string", create_strings),
+                ("concept", create_concepts)]
+
+    if dumpdir is not None:
+        paths = {name: dump_path(dumpdir, dbname, name, dumpformat, compress)
+                 for name, _ in builders}
+        _count_lines(pathtometadir,
+                     [name for name, path in paths.items()
+                      if overwrite or not os.path.exists(path)],
+                     process_definitions,
+                     process_relations,
+                     process_semantic_types,
+                     metrics)
+        for name, builder in builders:
+            path = paths[name]
+            if os.path.exists(path) and not overwrite:
+                print("{} already exists, not overwriting.".format(path))
+                continue
+            documents = builder()
+            with metrics.phase("dump_{}".format(name)) as stats:
+                stats.documents = write_dump(documents,
+                                             path,
+                                             dumpformat,
+                                             compress)
+            del(documents)
+        return None
+
+    client = get_client(host=host, port=port)
+    db = client.get_database(dbname)
 
-    try:
-        collection = db.create_collection("concept")
-        concepts = _create_concepts(pathtometadir,
-                                    process_definitions,
-                                    process_relations,
-                                    process_semantic_types,
-                                    languages,
-                                    preprocessor)
-        collection.insert_many(concepts)
-        del(concepts)
-    except CollectionInvalid:
-        if overwrite:
-            collection = db.create_collection("concept")
-            concepts = _create_concepts(pathtometadir,
-                                        process_definitions,
-                                        process_relations,
-                                        process_semantic_types,
-                                        languages,
-                                        preprocessor)
-            collection.insert_many(concepts)
-            del(concepts)
-        else:
-            print("concept already exists, not overwriting.")
+    if writers <= 0:
+        existing = set(db.list_collection_names())
+        _count_lines(pathtometadir,
+                     [name for name, _ in builders
+                      if overwrite or name not in existing],
+                     process_definitions,
+                     process_relations,
+                     process_semantic_types,
+                     metrics)
+
+    if writers > 0:
+        from .pipeline import build_pipelined
+        build_pipelined(db,
+                        pathtometadir,
+                        languages,
+                        process_definitions,
+                        process_relations,
+                        process_semantic_types,
+                        preprocessor,
+                        overwrite,
+                        prefetch,
+                        num_writers=writers,
+                        batch_size=batch_size,
+                        metrics=metrics)
+    else:
+        for name, builder in builders:
+            _insert_collection(db, name, builder, overwrite, metrics)
+
+    with metrics.phase("index"):
+        create_indexes(db)
 
     return db
 
 
+def _count_lines(path,
+                 collections,
+                 process_definitions,
+                 process_relations,
+                 process_semantic_types,
+                 metrics):
+    """
+    Count the lines of the RRF files for the progress bars.
+
+    Counting reads the files, so it is done in a separate phase, before
+    the files are parsed. The counts are cached, so the parsing phases
+    only read every file once. Only the files which are needed to build
+    collections are counted, and nothing is counted if collections is
+    empty.
+    """
+    if not collections:
+        return
+    names = ["MRCONSO"]
+    if "concept" in collections:
+        if process_definitions:
+            names.append("MRDEF")
+        if process_relations:
+            names.append("MRREL")
+        if process_semantic_types:
+            names.append("MRSTY")
+    with metrics.phase("count_lines") as stats:
+        for name in names:
+            stats.records += count_lines(path, name) or 0
+
+
+def _insert_collection(db, name, builder, overwrite, metrics):
+    """
+    Create a collection, and insert the documents created by builder.
+
+    Parameters
+    ----------
+    db : MongoDB.DB
+        The database in which to create the collection.
+    name : string
+        The name of the collection.
+    builder : function
+        A function without arguments which returns a list of documents.
+    overwrite : bool
+        Whether to drop the collection if it already exists.
+    metrics : BuildMetrics
+        The metrics to which to add the insert phase.
+
+    """
+    collection = _prepare_collection(db, name, overwrite)
+    if collection is None:
+        return
+
+    documents = builder()
+    with metrics.phase("insert_{}".format(name)) as stats:
+        collection.insert_many(documents)
+        stats.documents = len(documents)
+    del(documents)
+
+
+def _prepare_collection(db, name, overwrite):
+    """
+    Create an empty collection.
+
+    Parameters
+    ----------
+    db : MongoDB.DB
+        The database in which to create the collection.
+    name : string
+        The name of the collection.
+    overwrite : bool
+        Whether to drop the collection if it already exists.
+
+    Returns
+    -------
+    collection : MongoDB.Collection or None
+        The new collection, or None if it already exists and should not
+        be overwritten.
+
+    """
+    try:
+        return db.create_collection(name)
+    except CollectionInvalid:
+        if not overwrite:
+            print("{} already exists, not overwriting.".format(name))
+            return None
+        db.drop_collection(name)
+        return db.create_collection(name)
+
+
 def _create_concepts(path,
                      process_definitions,
                      process_relations,
                      process_semantic_types,
                      languages,
-                     preprocessor):
+                     preprocessor,
+                     prefetch=None,
+                     metrics=None):
     """
     Read MRCONSO for concepts.
 
@@ -184,55 +341,108 @@ def _create_concepts(path,
         The languages to use.
     preprocessor : function
         A function which preprocesses the data.
+    prefetch : string, optional, default None
+        Whether to decompress the RRF files in the background, see
+        `humumls.rrf.read_rrf`.
+    metrics : BuildMetrics, optional, default None
+        The metrics to which to add the phases.
 
     Returns
     -------
-    concepts : dict
-        Dictionary of concept data, to be added to the database.
+    concepts : list
+        List of concept data, to be added to the database.
 
     """
-    concepts = defaultdict(dict)
+    if metrics is None:
+        metrics = BuildMetrics()
 
-    mrcsonsopath = os.path.join(path, "MRCONSO.RRF")
+    with metrics.phase("mrconso_concepts") as stats:
+        concepts = process_mrconso(path, languages, prefetch, stats)
 
-    for idx, _ in enumerate(open(mrcsonsopath)):
-        pass
+    if process_definitions:
+        with metrics.phase("mrdef") as stats:
+            concepts = process_mrdef(path,
+                                     concepts,
+                                     languages,
+                                     preprocessor,
+                                     prefetch,
+                                     stats)
+    if process_relations:
+        with metrics.phase("mrrel") as stats:
+            concepts = process_mrrel(path, concepts, prefetch, stats)
+    if process_semantic_types:
+        with metrics.phase("mrsty") as stats:
+            concepts = process_mrsty(path, concepts, prefetch, stats)
+
+    with metrics.phase("finalize") as stats:
+        stats.documents = len(concepts)
+        return _finalize_concepts(concepts)
 
-    num_lines = idx
+
+def process_mrconso(path, languages, prefetch=None, stats=None):
+    """
+    Read the concepts from MRCONSO.RRF.
+
+    Parameters
+    ----------
+    path : string
+        The path to the META dir.
+    languages : list of str
+        The languages to use.
+    prefetch : string, optional, default None
+        Whether to decompress the RRF files in the background, see
+        `humumls.rrf.read_rrf`.
+    stats : PhaseStats, optional, default None
+        Counters to which to add the number of records and bytes read.
+
+    Returns
+    -------
+    concepts : dict
+        A dictionary mapping concept ids to intermediate concept data, to
+        which definitions, relations and semantic types can be added.
+
+    """
+    concepts = defaultdict(dict)
+
+    num_lines = count_lines(path, "MRCONSO")
     print("Reading MRCONSO for concepts.")
-    for record in tqdm(open(mrcsonsopath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRCONSO", prefetch, stats),
+                       total=num_lines):
         split = record.strip().split("|")
 
         if languages and split[1] not in languages:
             continue
 
-        cui = split[0]
-        sui = split[5]
-        lui = split[3]
+        _add_concept(concepts, split)
 
-        c = concepts[cui]
+    return concepts
 
-        c["_id"] = cui
 
-        if split[2] == "P":
-            c["preferred"] = lui
+def _add_concept(concepts, split):
+    """Add a single split MRCONSO record to the concepts."""
+    cui = split[0]
+    sui = split[5]
+    lui = split[3]
 
-        try:
-            c["lui"].add(lui)
-        except KeyError:
-            c["lui"] = set([lui])
-        try:
-            c["sui"].add(sui)
-        except KeyError:
-            c["sui"] = set([sui])
+    c = concepts[cui]
+
+    c["_id"] = cui
+
+    if split[2] == "P":
+        c["preferred"] = lui
+
+    try:
+        c["lui"].add(lui)
+    except KeyError:
+        c["lui"] = set([lui])
+    try:
+        c["sui"].add(sui)
+    except KeyError:
+        c["sui"] = set([sui])
 
-    if process_definitions:
-        concepts = process_mrdef(path, concepts, languages, preprocessor)
-    if process_relations:
-        concepts = process_mrrel(path, concepts)
-    if process_semantic_types:
-        concepts = process_mrsty(path, concepts)
 
+def _finalize_concepts(concepts):
+    """Turn the intermediate concept data into a list of documents."""
     for v in concepts.values():
         try:
             v['lui'] = list(v['lui'])
@@ -246,118 +456,118 @@ def _create_concepts(path,
     return list(concepts.values())
 
 
-def _create_terms(path, languages):
+def _create_terms(path, languages, prefetch=None, stats=None):
     """Read MRCONSO for terms."""
     terms = defaultdict(dict)
 
-    mrcsonsopath = os.path.join(path, "MRCONSO.RRF")
-
-    for idx, _ in enumerate(open(mrcsonsopath)):
-        pass
-
-    num_lines = idx
+    num_lines = count_lines(path, "MRCONSO")
 
     print("Reading MRCONSO for terms.")
-    for record in tqdm(open(mrcsonsopath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRCONSO", prefetch, stats),
+                       total=num_lines):
 
         split = record.strip().split("|")
 
         if languages and split[1] not in languages:
             continue
 
-        cui = split[0]
-        sui = split[5]
-        lui = split[3]
+        _add_term(terms, split)
 
-        t = terms[lui]
+    return list(terms.values())
 
-        t["_id"] = lui
-        try:
-            t["cui"].append(cui)
-        except KeyError:
-            t["cui"] = [cui]
-        try:
-            t["sui"].append(sui)
-        except KeyError:
-            t["sui"] = [sui]
 
-    for v in terms.values():
-        t["sui"] = list(t["sui"])
-        t["cui"] = list(t["cui"])
+def _add_term(terms, split):
+    """Add a single split MRCONSO record to the terms."""
+    cui = split[0]
+    sui = split[5]
+    lui = split[3]
 
-    return list(terms.values())
+    t = terms[lui]
+
+    t["_id"] = lui
+    try:
+        t["cui"].append(cui)
+    except KeyError:
+        t["cui"] = [cui]
+    try:
+        t["sui"].append(sui)
+    except KeyError:
+        t["sui"] = [sui]
 
 
-def _create_strings(path, languages):
+def _create_strings(path, languages, prefetch=None, stats=None):
     """Read MRCONSO for strings."""
     strings = defaultdict(dict)
 
-    mrcsonsopath = os.path.join(path, "MRCONSO.RRF")
-
-    for idx, _ in enumerate(open(mrcsonsopath)):
-        pass
-
-    num_lines = idx
+    num_lines = count_lines(path, "MRCONSO")
 
     print("Reading MRCONSO for strings.")
-    for record in tqdm(open(mrcsonsopath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRCONSO", prefetch, stats),
+                       total=num_lines):
 
         split = record.strip().split("|")
-        string = split[14]
-
-        # Check BSON length
-        byte_string = string.encode("utf-8")
-        if len(byte_string) >= 1000:
-            # Truncate 1000 bytes
-            string = byte_string[:1000].decode('utf-8')
 
         if languages and split[1] not in languages:
             continue
 
-        cui = split[0]
-        sui = split[5]
-        lui = split[3]
-
-        # Create lexical representation.
-        tokenized = " ".join(PUNCT.sub(" ", string).split())
-
-        s = strings[sui]
-
-        s["_id"] = sui
-        s["string"] = string
-        s["lower"] = string.lower()
-        s["tokenized"] = tokenized
-        s["lang"] = split[1]
-        s["numwords"] = len(string.split())
-        s["numwordslower"] = len(tokenized.split())
-        s["lui"] = lui
-        try:
-            s["cui"].add(cui)
-        except KeyError:
-            s["cui"] = set([cui])
+        _add_string(strings, split)
+
+    return _finalize_strings(strings)
+
 
+def _add_string(strings, split):
+    """Add a single split MRCONSO record to the strings."""
+    string = split[14]
+
+    # Check BSON length
+    byte_string = string.encode("utf-8")
+    if len(byte_string) >= 1000:
+        # Truncate 1000 bytes
+        string = byte_string[:1000].decode('utf-8')
+
+    cui = split[0]
+    sui = split[5]
+    lui = split[3]
+
+    # Create lexical representation.
+    tokenized = " ".join(PUNCT.sub(" ", string).split())
+
+    s = strings[sui]
+
+    s["_id"] = sui
+    s["string"] = string
+    s["lower"] = string.lower()
+    s["tokenized"] = tokenized
+    s["lang"] = split[1]
+    s["numwords"] = len(string.split())
+    s["numwordslower"] = len(tokenized.split())
+    s["lui"] = lui
+    try:
+        s["cui"].add(cui)
+    except KeyError:
+        s["cui"] = set([cui])
+
+
+def _finalize_strings(strings):
+    """Turn the intermediate string data into a list of documents."""
     for v in strings.values():
         v['cui'] = list(v['cui'])
 
     return list(strings.values())
 
 
-def process_mrrel(path, concepts):
+def process_mrrel(path, concepts, prefetch=None, stats=None):
     """
     Read the relations from MRREL.RRF, and add them to concepts.
 
     Because bidirectional relations in UMLS occur for both directions,
     only the direction which occurs in the UMLS is added.
     """
-    mrrelpath = os.path.join(path, "MRREL.RRF")
-
-    for idx, _ in enumerate(open(mrrelpath)):
-        pass
-
-    num_lines = idx
+    num_lines = count_lines(path, "MRREL")
 
     print("Reading MRREL.RRF for relations.")
-    for record in tqdm(open(mrrelpath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRREL", prefetch, stats),
+                       total=num_lines):
 
         split = record.strip().split("|")
 
@@ -388,7 +598,9 @@ def process_mrrel(path, concepts):
 def process_mrdef(path,
                   concepts,
                   languages,
-                  preprocessor):
+                  preprocessor,
+                  prefetch=None,
+                  stats=None):
     """
     Read definitions from MRDEF.RRF.
 
@@ -406,6 +618,11 @@ def process_mrdef(path,
     preprocessor : function
         Function that preprocesses the defintions. Should be a function which
         takes a string as input and returns a string.
+    prefetch : string, optional, default None
+        Whether to decompress the RRF files in the background, see
+        `humumls.rrf.read_rrf`.
+    stats : PhaseStats, optional, default None
+        Counters to which to add the number of records and bytes read.
 
     Returns
     -------
@@ -416,15 +633,11 @@ def process_mrdef(path,
     isolanguages = {LANGDICT[l.upper()] for l in languages}
     print(isolanguages)
 
-    mrdefpath = os.path.join(path, "MRDEF.RRF")
-
-    for idx, _ in enumerate(open(mrdefpath)):
-        pass
-
-    num_lines = idx
+    num_lines = count_lines(path, "MRDEF")
 
     print("Reading MRDEF.RRF for definitions.")
-    for record in tqdm(open(mrdefpath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRDEF", prefetch, stats),
+                       total=num_lines):
         split = record.strip().split("|")
 
         cui = split[0]
@@ -448,17 +661,13 @@ def process_mrdef(path,
     return concepts
 
 
-def process_mrsty(path, concepts):
+def process_mrsty(path, concepts, prefetch=None, stats=None):
     """Read semantic types from MRSTY.RRF."""
-    mrstypath = os.path.join(path, "MRSTY.RRF")
-
-    for idx, _ in enumerate(open(mrstypath)):
-        pass
-
-    num_lines = idx
+    num_lines = count_lines(path, "MRSTY")
 
     print("Reading MRSTY.RRF for semantic types.")
-    for record in tqdm(open(mrstypath), total=num_lines):
+    for record in tqdm(read_rrf(path, "MRSTY", prefetch, stats),
+                       total=num_lines):
         split = record.strip().split("|")
 
         cui = split[0]
@@ -0,0 +1,63 @@
+"""Tests for the RRF readers."""
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from humumls.rrf import find_parts, read_rrf
+
+
+class TestFindParts(unittest.TestCase):
+    """Test which files make up an RRF file."""
+
+    def setUp(self):
+        """Create a directory with the parts of MRCONSO."""
+        self.path = tempfile.mkdtemp()
+        self.parts = {"aa": b"C1|ENG\nC2|ENG\n", "ab": b"C3|DUT\n"}
+
+    def tearDown(self):
+        """Remove the directory."""
+        shutil.rmtree(self.path)
+
+    def write(self, filename, data, compress=False):
+        """Write a file to the directory."""
+        opener = gzip.open if compress else open
+        with opener(os.path.join(self.path, filename), "wb") as f:
+            f.write(data)
+
+    def test_mixed_parts(self):
+        """Parts which are both extracted and compressed are read once."""
+        for suffix, data in self.parts.items():
+            self.write("MRCONSO.RRF." + suffix, data)
+            self.write("MRCONSO.RRF.{}.gz".format(suffix), data, True)
+
+        parts = [os.path.basename(f)
+                 for _, f in find_parts(self.path, "MRCONSO")]
+        self.assertEqual(parts, ["MRCONSO.RRF.aa", "MRCONSO.RRF.ab"])
+        self.assertEqual(list(read_rrf(self.path, "MRCONSO")),
+                         ["C1|ENG", "C2|ENG", "C3|DUT"])
+
+    def test_partly_extracted(self):
+        """Extracted parts are combined with compressed parts."""
+        self.write("MRCONSO.RRF.aa", self.parts["aa"])
+        self.write("MRCONSO.RRF.ab.gz", self.parts["ab"], True)
+
+        parts = [os.path.basename(f)
+                 for _, f in find_parts(self.path, "MRCONSO")]
+        self.assertEqual(parts, ["MRCONSO.RRF.aa", "MRCONSO.RRF.ab.gz"])
+        self.assertEqual(list(read_rrf(self.path, "MRCONSO")),
+                         ["C1|ENG", "C2|ENG", "C3|DUT"])
+
+    def test_whole_file(self):
+        """A whole file is preferred over its parts."""
+        self.write("MRCONSO.RRF.gz", b"".join(self.parts.values()), True)
+        self.write("MRCONSO.RRF.aa", self.parts["aa"])
+
+        parts = [os.path.basename(f)
+                 for _, f in find_parts(self.path, "MRCONSO")]
+        self.assertEqual(parts, ["MRCONSO.RRF.gz"])
+
+
+if __name__ == "__main__":
+    unittest.main()